@@ -6,7 +6,7 @@ REST API クライアント実装
 import asyncio
 import logging
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 import httpx
 
@@ -24,6 +24,9 @@ class CocoroDockClient:
             limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
             http2=False,  # ローカル接続なのでHTTP/1.1で十分
         )
+        # 未送信の最新ステータスと送信タスク（連続した更新は最新のものだけ送る）
+        self._pending_status: Optional[Tuple[str, Optional[str]]] = None
+        self._status_task: Optional[asyncio.Task] = None
 
     async def send_chat_message(self, role: str, content: str) -> bool:
         """
@@ -138,6 +141,27 @@ class CocoroDockClient:
             logger.debug(f"ステータス更新エラー（正常動作）: {e}")
             return False
 
+    def queue_status_update(self, message: str, status_type: Optional[str] = None) -> None:
+        """
+        ステータス更新を送信待ちにして即座に戻る
+
+        送信中に届いた更新はまとめられ、最新のものだけが送信される
+
+        Args:
+            message: ステータスメッセージ
+            status_type: ステータスタイプ
+        """
+        self._pending_status = (message, status_type)
+        if self._status_task is None or self._status_task.done():
+            self._status_task = asyncio.create_task(self._flush_status_updates())
+
+    async def _flush_status_updates(self):
+        """送信待ちのステータス更新がなくなるまで送信"""
+        while self._pending_status is not None:
+            message, status_type = self._pending_status
+            self._pending_status = None
+            await self.send_status_update(message, status_type=status_type)
+
     async def close(self):
         """クライアントを閉じる"""
         await self.client.aclose()
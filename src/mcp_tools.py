@@ -1,28 +1,282 @@
 """MCPサーバーと統合するLLMツール（JSON-RPC直接通信版）"""
 
 import asyncio
+import hashlib
+import itertools
 import json
 import logging
 import os
+import platform
+import shutil
 import signal
-from typing import Any, Dict, List, Optional
+import subprocess
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjsonは任意依存（未インストール時は標準jsonを使用）
+    orjson = None
 
 logger = logging.getLogger(__name__)
-# デバッグログを有効化
-logger.setLevel(logging.DEBUG)
+
+# npm view の確認結果キャッシュ（設定ディレクトリに保存、24時間有効）
+NPM_VIEW_CACHE_FILENAME = ".npm_view_cache.json"
+NPM_VIEW_CACHE_TTL = 24 * 60 * 60
+
+# tools/list の結果キャッシュ（設定ディレクトリに保存、24時間有効）
+TOOL_CATALOG_CACHE_FILENAME = "mcp_tool_cache.json"
+TOOL_CATALOG_CACHE_TTL = 24 * 60 * 60
+
+# 並列接続時に同時に起動するMCPサーバーの上限
+MAX_CONCURRENT_CONNECTIONS = 8
+
+# ツール実行がないまま経過するとサーバープロセスを停止する時間（秒）と確認間隔（秒）
+# 停止後もツールは登録されたままで、次の実行時に再起動する
+# cocoroAiMcp.json の "idleTimeout"（全体）またはサーバーごとの "idleTimeout" で変更でき、0で無効
+IDLE_SERVER_TIMEOUT = 300.0
+IDLE_CHECK_INTERVAL = 30.0
+
+# サーバー起動（プロセス起動から初期化・ツール一覧取得まで）の上限時間（秒）
+CONNECT_TIMEOUT = 15.0
+
+# ツール実行応答の待機時間（秒）
+TOOL_CALL_TIMEOUT = 30.0
+
+# サーバー切断時の終了待ち時間（秒）: 終了要求後、応じなければ強制終了してさらに待つ
+PROCESS_TERMINATE_TIMEOUT = 1.0
+PROCESS_KILL_TIMEOUT = 2.0
+DISCONNECT_ALL_TIMEOUT = 5.0  # 全サーバー切断の上限時間（秒）
+
+# エラー診断用に読み取る標準エラー出力の上限バイト数
+STDERR_READ_LIMIT = 4096
+
+# 標準出力の1行（JSON-RPCメッセージ1件）の上限バイト数
+# 既定の64KiBでは大きなtools/list応答で読み取りが失敗し、バッファも細かく伸長されるため拡張する
+STDOUT_READ_LIMIT = 1 << 20
+
+# Windows環境でコンソールウィンドウを非表示にするためのプロセス作成フラグ
+CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
+
+# 初期化メッセージ（全サーバー共通のため事前にシリアライズしておく）
+INIT_MESSAGE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "CocoroCore", "version": "1.0.0"}
+    }
+}
+
+
+def _encode_message(message: Dict[str, Any]) -> bytes:
+    """JSON-RPCメッセージを改行区切りのバイト列にシリアライズ"""
+    if orjson is not None:
+        # 改行もorjson側で付加し、バイト列の連結コピーを避ける
+        return orjson.dumps(message, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(message) + "\n").encode('utf-8')
+
+
+def _decode_message(line: bytes) -> Dict[str, Any]:
+    """受信した1行（バイト列）をJSON-RPCメッセージとして解析
+
+    orjson/jsonともにbytesを直接受け付け、末尾の改行も無視するため
+    decode/stripの中間文字列は作らない
+    """
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+INIT_MESSAGE_BYTES = _encode_message(INIT_MESSAGE)
+
+# ツール一覧取得メッセージ（初期化と同様に固定内容のため事前にシリアライズ）
+TOOLS_LIST_MESSAGE_BYTES = _encode_message({
+    "jsonrpc": "2.0",
+    "id": 2,
+    "method": "tools/list"
+})
+
+
+async def _send_message(process, data: bytes):
+    """シリアライズ済みのメッセージをサーバーの標準入力へ書き込む"""
+    process.stdin.write(data)
+    await process.stdin.drain()
+
+
+def _read_cache_file(path: Optional[str]) -> Dict[str, Any]:
+    """JSONキャッシュファイルを読み込む（存在しない・壊れている場合は空）"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except Exception as e:
+        logger.debug(f"キャッシュの読み込みに失敗: {path} - {e}")
+        return {}
+
+
+def _write_cache_file(path: Optional[str], cache_data: Dict[str, Any]):
+    """JSONキャッシュファイルを書き込む（アトミックに置換）"""
+    if not path:
+        return
+    tmp_path = None
+    try:
+        # 並列接続時に一時ファイルが衝突しないよう個別に作成
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache_data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.debug(f"キャッシュの保存に失敗: {path} - {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _build_tool_spec(tool_key: str, tool: dict) -> dict:
+    """MCPツール定義をAIAvatarKitのツール仕様に変換"""
+    # JSON-RPC方式では辞書形式でツール情報が返される
+    parameters = tool.get('inputSchema', {
+        "type": "object",
+        "properties": {},
+        "required": []
+    })
+    return {
+        "type": "function",
+        "function": {
+            "name": tool_key,
+            "description": tool.get('description', ''),
+            "parameters": parameters
+        }
+    }
+
+
+@lru_cache(maxsize=64)
+def _which(command: str) -> Optional[str]:
+    """コマンドのパスを解決（PATH走査の結果をプロセス内でキャッシュ）
+
+    見つからなかった場合の結果は呼び出し側でキャッシュを破棄すること
+    """
+    return shutil.which(command)
 
 
 class MCPServerManager:
     """MCPサーバーの管理とライフサイクル制御（JSON-RPC直接通信版）"""
     
-    def __init__(self, servers_config: Dict):
+    def __init__(self, servers_config: Dict, config_dir: Optional[str] = None, idle_timeout: Optional[float] = IDLE_SERVER_TIMEOUT):
         self.servers_config = servers_config
         self.available_tools: Dict[str, Any] = {}
+        self._tools_by_server: Dict[str, Set[str]] = {}  # サーバー名 → ツールキーの索引
+        # 子プロセスに渡す環境変数のベース（接続ごとにos.environ全体を複製しないようにする）
+        # 共有しているため変更しないこと
+        self._base_env: Dict[str, str] = dict(os.environ)
         self.server_processes = {}
         self.tool_registration_log: List[str] = []  # ツール登録ログを保存
-        
+        # npm view の確認結果キャッシュ {パッケージ名: {"ts": 確認時刻, "ok": 結果}}
+        self._npm_view_cache_path = os.path.join(config_dir, NPM_VIEW_CACHE_FILENAME) if config_dir else None
+        self._npm_view_cache: Dict[str, Dict[str, Any]] = _read_cache_file(self._npm_view_cache_path)
+        self._npm_view_pending: Dict[str, asyncio.Future] = {}
+        self._npm_view_write_lock = asyncio.Lock()
+        # tools/list の結果キャッシュ {サーバー名: {"key": 設定のハッシュ, "ts": 取得時刻, "tools": ツール一覧}}
+        self._tool_catalog_cache_path = os.path.join(config_dir, TOOL_CATALOG_CACHE_FILENAME) if config_dir else None
+        self._tool_catalog_cache: Dict[str, Dict[str, Any]] = _read_cache_file(self._tool_catalog_cache_path)
+        self._tool_catalog_write_lock = asyncio.Lock()
+        # サーバーごとの応答読み取りタスクと、リクエストIDごとの応答待ちFuture
+        # （ID 1, 2 は初期化とtools/listで使用するため3から採番）
+        self._request_ids = itertools.count(3)
+        self._reader_tasks: Dict[str, asyncio.Task] = {}
+        self._pending_requests: Dict[str, Dict[int, asyncio.Future]] = {}
+        # サーバーごとの書き込みロック（並行リクエストのwrite/drainを直列化）
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        # キャッシュからツールのみ登録し、プロセスは初回のツール実行時に起動するサーバー
+        self._lazy_servers: Set[str] = set()
+        self._start_locks: Dict[str, asyncio.Lock] = {}
+        # アイドル状態のサーバー停止（Noneまたは0で無効、サーバー設定のidleTimeoutが優先）
+        self._idle_timeout = idle_timeout
+        self._last_used: Dict[str, float] = {}
+        self._idle_reaper_task: Optional[asyncio.Task] = None
+        # 全サーバー切断後はプロセスを起動しない
+        self._closed = False
+
+    def _is_npm_view_cached(self, package_name: str) -> bool:
+        """パッケージが有効期限内に利用可能と確認済みかどうか"""
+        entry = self._npm_view_cache.get(package_name)
+        if not isinstance(entry, dict) or not entry.get("ok"):
+            return False
+        return time.time() - entry.get("ts", 0) < NPM_VIEW_CACHE_TTL
+
+    @staticmethod
+    def _tool_catalog_key(server_config: dict) -> str:
+        """起動設定（コマンド・引数・環境変数）からツール一覧キャッシュのキーを算出"""
+        source = json.dumps(
+            {
+                "command": server_config.get("command", ""),
+                "args": server_config.get("args", []),
+                "env": server_config.get("env", {}),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def _get_cached_tools(self, server_name: str, server_config: dict) -> Optional[List[dict]]:
+        """起動設定が変わっておらず有効期限内であれば、キャッシュしたツール一覧を返す"""
+        entry = self._tool_catalog_cache.get(server_name)
+        if not isinstance(entry, dict) or entry.get("key") != self._tool_catalog_key(server_config):
+            return None
+        if time.time() - entry.get("ts", 0) >= TOOL_CATALOG_CACHE_TTL:
+            return None
+        tools = entry.get("tools")
+        return tools if isinstance(tools, list) else None
+
+    async def _store_cached_tools(self, server_name: str, server_config: dict, tools: List[dict]):
+        """取得したツール一覧をキャッシュに保存"""
+        self._tool_catalog_cache[server_name] = {
+            "key": self._tool_catalog_key(server_config),
+            "ts": time.time(),
+            "tools": tools,
+        }
+        await self._save_tool_catalog_cache()
+
+    async def _invalidate_cached_tools(self, server_name: str):
+        """接続に失敗したサーバーのツール一覧キャッシュを破棄"""
+        if self._tool_catalog_cache.pop(server_name, None) is not None:
+            await self._save_tool_catalog_cache()
+
+    async def _save_tool_catalog_cache(self):
+        """ツール一覧キャッシュをファイルに保存
+
+        並列接続時に古いスナップショットが後から書き込まれないよう、スナップショットの取得と書き込みを直列化する
+        """
+        if not self._tool_catalog_cache_path:
+            return
+        async with self._tool_catalog_write_lock:
+            await asyncio.to_thread(_write_cache_file, self._tool_catalog_cache_path, dict(self._tool_catalog_cache))
+
+    async def _invalidate_connect_caches(self, server_name: str):
+        """接続に失敗したサーバーのコマンドパス解決とツール一覧のキャッシュを破棄"""
+        _which.cache_clear()
+        await self._invalidate_cached_tools(server_name)
+
     async def connect_server(self, server_name: str, server_config: dict):
         """MCPサーバーに接続（JSON-RPC方式のみ）"""
+        if self._closed:
+            logger.info(f"MCPシステム停止済みのため '{server_name}' には接続しません")
+            return
+        
+        # ツール一覧がキャッシュ済みならツールのみ登録し、プロセス起動は初回実行時まで遅延
+        cached_tools = self._get_cached_tools(server_name, server_config)
+        if cached_tools is not None:
+            self._register_server_tools(server_name, server_config, cached_tools, None)
+            self._lazy_servers.add(server_name)
+            logger.info(f"MCPサーバー '{server_name}' のツールをキャッシュから登録（プロセスは初回実行時に起動）")
+            return
         
         logger.info(f"MCPサーバー '{server_name}' に接続中（JSON-RPC方式）...")
         
@@ -65,39 +319,46 @@ class MCPServerManager:
             logger.warning("NPXパッケージ名を特定できません")
             return True  # 特定できない場合は通す
         
+        # 有効期限内に確認済みのパッケージは npm view を省略
+        # （失敗結果はネットワーク一時障害の可能性があるためキャッシュしない）
+        if self._is_npm_view_cached(package_name):
+            logger.info(f"✅ NPXパッケージが利用可能（キャッシュ）: {package_name}")
+            return True
+        
+        # 同じパッケージを使う複数サーバーの並列接続時は npm view を1回にまとめる
+        pending = self._npm_view_pending.get(package_name)
+        if pending is None:
+            pending = asyncio.ensure_future(self._run_npm_view(package_name, env))
+            self._npm_view_pending[package_name] = pending
+            pending.add_done_callback(lambda _: self._npm_view_pending.pop(package_name, None))
+        # 待機側がタイムアウトでキャンセルされても共有中の確認処理は継続させる
+        return await asyncio.shield(pending)
+    
+    async def _run_npm_view(self, package_name: str, env: dict) -> bool:
+        """npm view でパッケージの存在を確認"""
         try:
             # パッケージの存在確認（npm view コマンドを使用）
-            import os
-            import subprocess
-
-            # Windows環境では空の環境変数辞書を渡すとエラーになるため、
-            # 現在の環境変数をベースにして追加の環境変数をマージ
-            full_env = os.environ.copy()
-            if env:
-                full_env.update(env)
-            
-            # Windows環境でコンソールウィンドウを非表示にする
-            import platform
-            creation_flags = 0
-            if platform.system() == "Windows":
-                import subprocess
-                creation_flags = subprocess.CREATE_NO_WINDOW
+            # 呼び出し元で現在の環境変数とマージ済みのためそのまま渡す
+            # （Windows環境では空の環境変数辞書を渡すとエラーになるため、空ならNoneで継承）
+            full_env = env or None
             
             result = await asyncio.create_subprocess_exec(
                 "npm", "view", package_name, "name",
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 env=full_env,
-                creationflags=creation_flags
+                creationflags=CREATION_FLAGS
             )
             stdout, stderr = await asyncio.wait_for(result.communicate(), timeout=10.0)
             
             if result.returncode == 0:
                 logger.info(f"✅ NPXパッケージが利用可能: {package_name}")
+                self._npm_view_cache[package_name] = {"ts": time.time(), "ok": True}
+                await self._save_npm_view_cache()
                 return True
             else:
                 logger.error(f"❌ NPXパッケージが見つかりません: {package_name}")
-                logger.debug(f"npm view エラー: {stderr.decode('utf-8', errors='ignore')}")
+                logger.debug(f"npm view エラー: {stderr[:STDERR_READ_LIMIT].decode('utf-8', errors='replace')}")
                 return False
         
         except asyncio.TimeoutError:
@@ -107,6 +368,27 @@ class MCPServerManager:
             logger.error(f"NPXパッケージ確認エラー: {e}")
             return False
     
+    async def _save_npm_view_cache(self):
+        """npm view の確認結果キャッシュをファイルに保存
+
+        並列接続時に古いスナップショットが後から書き込まれないよう、スナップショットの取得と書き込みを直列化する
+        """
+        if not self._npm_view_cache_path:
+            return
+        async with self._npm_view_write_lock:
+            await asyncio.to_thread(_write_cache_file, self._npm_view_cache_path, dict(self._npm_view_cache))
+    
+    async def _read_stderr(self, process) -> str:
+        """プロセスの標準エラー出力を上限付きで読み取る（大量出力時のメモリ消費を防ぐ）"""
+        if process.stderr is None:
+            return ""
+        try:
+            stderr_data = await asyncio.wait_for(process.stderr.read(STDERR_READ_LIMIT), timeout=1.0)
+        except Exception as e:
+            logger.debug(f"標準エラー出力の読み取りに失敗: {e}")
+            return ""
+        return stderr_data.decode('utf-8', errors='replace').strip()
+    
     async def _connect_server_jsonrpc(self, server_name: str, server_config: dict):
         """JSON-RPC方式でMCPサーバーに接続（anyio問題を完全回避）"""
         
@@ -119,23 +401,27 @@ class MCPServerManager:
         if not command:
             raise ValueError(f"MCPサーバー '{server_name}' のコマンドが設定されていません")
         
-        # 環境変数の処理
-        processed_env = os.environ.copy()
+        # 環境変数の処理（上書き分のみ抽出し、ない場合は現在の環境変数をそのまま継承）
+        env_overrides = {}
         for key, value in env_vars.items():
             if isinstance(value, str) and value.startswith("env:"):
                 env_var_name = value[4:]
-                env_value = os.environ.get(env_var_name)
+                env_value = self._base_env.get(env_var_name)
                 if env_value:
-                    processed_env[key] = env_value
+                    env_overrides[key] = env_value
             else:
-                processed_env[key] = value
+                env_overrides[key] = value
+        processed_env = {**self._base_env, **env_overrides} if env_overrides else None
         
-        # コマンドの存在確認
-        import shutil
-        if not shutil.which(command):
+        # コマンドの存在確認（PATH走査はブロッキングI/Oのためスレッドで実行）
+        resolved_command = await asyncio.to_thread(_which, command)
+        if not resolved_command:
+            # 見つからなかった結果はキャッシュに残さない（後からインストールされた場合に再解決させる）
+            await self._invalidate_connect_caches(server_name)
             error_msg = f"コマンドが見つかりません: {command}"
             self.tool_registration_log.append(f"コマンド確認失敗: {server_name}サーバー - {error_msg}")
             raise ValueError(error_msg)
+        logger.debug(f"コマンドのパス: {resolved_command}")
         
         # npxの場合はパッケージ確認
         if command == "npx" and args:
@@ -146,40 +432,28 @@ class MCPServerManager:
                 raise ValueError(error_msg)
         
         # プロセスを直接起動（Windows環境でコンソールウィンドウを非表示）
-        import platform
-        creation_flags = 0
-        if platform.system() == "Windows":
-            # Windows環境でコンソールウィンドウを作成しない
-            import subprocess
-            creation_flags = subprocess.CREATE_NO_WINDOW
-        
-        process = await asyncio.create_subprocess_exec(
-            command, *args,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=processed_env,
-            creationflags=creation_flags
-        )
+        try:
+            process = await asyncio.create_subprocess_exec(
+                command, *args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=processed_env,
+                creationflags=CREATION_FLAGS,
+                limit=STDOUT_READ_LIMIT
+            )
+        except FileNotFoundError:
+            # キャッシュしたパス解決とツール一覧が古くなっている場合は次回に再取得させる
+            await self._invalidate_connect_caches(server_name)
+            error_msg = f"コマンドが見つかりません: {command}"
+            self.tool_registration_log.append(f"コマンド確認失敗: {server_name}サーバー - {error_msg}")
+            raise ValueError(error_msg)
         
         logger.debug(f"MCPサーバープロセス起動成功 PID: {process.pid}")
         
         try:
             # 1. 初期化メッセージ送信
-            init_message = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "initialize",
-                "params": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {},
-                    "clientInfo": {"name": "CocoroCore", "version": "1.0.0"}
-                }
-            }
-            
-            message_json = json.dumps(init_message) + "\n"
-            process.stdin.write(message_json.encode('utf-8'))
-            await process.stdin.drain()
+            await _send_message(process, INIT_MESSAGE_BYTES)
             
             # 初期化応答待機
             response_line = await asyncio.wait_for(
@@ -188,65 +462,67 @@ class MCPServerManager:
             )
             
             if not response_line:
+                stderr_output = await self._read_stderr(process)
+                if stderr_output:
+                    raise Exception(f"初期化応答がありません: {stderr_output}")
                 raise Exception("初期化応答がありません")
             
-            init_response = json.loads(response_line.decode('utf-8').strip())
+            init_response = _decode_message(response_line)
             logger.info(f"MCPサーバー '{server_name}' 初期化成功")
-            logger.debug(f"初期化応答: {init_response}")
-            
-            # 2. tools/list リクエスト送信
-            tools_message = {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "method": "tools/list"
-            }
-            
-            message_json = json.dumps(tools_message) + "\n"
-            process.stdin.write(message_json.encode('utf-8'))
-            await process.stdin.drain()
-            
-            # ツールリスト応答待機
-            tools_response_line = await asyncio.wait_for(
-                process.stdout.readline(),
-                timeout=10.0
-            )
-            
-            if not tools_response_line:
-                logger.warning(f"MCPサーバー '{server_name}' からツールリスト応答なし")
-                return
-            
-            tools_response = json.loads(tools_response_line.decode('utf-8').strip())
-            # logger.debug(f"ツールリスト応答: {tools_response}")
+            logger.debug("初期化応答: %s", init_response)
             
-            # 3. ツール登録
-            if 'result' in tools_response and 'tools' in tools_response['result']:
-                tools = tools_response['result']['tools']
-                logger.info(f"MCPサーバー '{server_name}' から {len(tools)} 個のツールを取得")
+            # 2. ツール一覧取得（起動設定が同じならキャッシュを使いtools/listを省略）
+            tools = self._get_cached_tools(server_name, server_config)
+            if tools is not None:
+                logger.info(f"MCPサーバー '{server_name}' のツール一覧をキャッシュから取得: {len(tools)} 個")
+            else:
+                await _send_message(process, TOOLS_LIST_MESSAGE_BYTES)
+                
+                # ツールリスト応答待機
+                tools_response_line = await asyncio.wait_for(
+                    process.stdout.readline(),
+                    timeout=10.0
+                )
                 
-                for tool in tools:
-                    tool_key = f"{server_name}_{tool['name']}"
-                    self.available_tools[tool_key] = {
-                        "server": server_name,
-                        "tool": tool,
-                        "process": process,
-                        "config": server_config,
-                        "jsonrpc_mode": True
-                    }
-                    logger.info(f"ツール登録（JSON-RPC）: {tool_key} - {tool.get('description', '')}")
+                if not tools_response_line:
+                    logger.warning(f"MCPサーバー '{server_name}' からツールリスト応答なし")
+                    return
                 
-                # プロセスを保存
+                tools_response = _decode_message(tools_response_line)
+                # logger.debug(f"ツールリスト応答: {tools_response}")
+                
+                if 'result' in tools_response and 'tools' in tools_response['result']:
+                    tools = tools_response['result']['tools']
+                    logger.info(f"MCPサーバー '{server_name}' から {len(tools)} 個のツールを取得")
+                    await self._store_cached_tools(server_name, server_config, tools)
+                else:
+                    logger.warning(f"MCPサーバー '{server_name}' からツールリストを取得できませんでした")
+                    logger.debug("応答内容: %s", tools_response)
+            
+            # 3. ツール登録（起動中に全サーバー切断が始まった場合は登録せずに終了させる）
+            if tools is not None and self._closed:
+                logger.info(f"MCPシステム停止中のため '{server_name}' のプロセスを終了します")
+                await self._terminate_process(server_name, process)
+            elif tools is not None:
+                self._register_server_tools(server_name, server_config, tools, process)
+                
+                # プロセスを保存し、応答の読み取りタスクを開始
                 self.server_processes[server_name] = process
+                self._lazy_servers.discard(server_name)
+                self._ensure_reader(server_name, process)
+                self._last_used[server_name] = time.monotonic()
+                self._ensure_idle_reaper()
                 logger.info(f"MCPサーバー '{server_name}' 接続完了（JSON-RPC方式）")
                 
-            else:
-                logger.warning(f"MCPサーバー '{server_name}' からツールリストを取得できませんでした")
-                logger.debug(f"応答内容: {tools_response}")
-                
+        except asyncio.CancelledError:
+            # 起動の上限時間を超えた場合など、呼び出し元に中断されてもプロセスを残さない
+            await self._abort_process(server_name, process)
+            raise
         except asyncio.TimeoutError:
             logger.error(f"MCPサーバー '{server_name}' の通信がタイムアウトしました")
             self.tool_registration_log.append(f"JSON-RPC通信タイムアウト: {server_name}サーバー")
-            process.terminate()
-            await process.wait()
+            await self._invalidate_connect_caches(server_name)
+            await self._abort_process(server_name, process)
             raise
         except Exception as e:
             import traceback
@@ -254,20 +530,115 @@ class MCPServerManager:
             logger.error(f"MCPサーバー '{server_name}' のJSON-RPC接続でエラー: {e}")
             logger.debug(f"JSON-RPCエラー詳細: {error_detail}")
             self.tool_registration_log.append(f"JSON-RPC接続失敗: {server_name}サーバー - {e}\n詳細: {str(e)}\nトレース: {error_detail}")
-            process.terminate()
-            await process.wait()
+            await self._invalidate_connect_caches(server_name)
+            await self._abort_process(server_name, process)
             raise
     
     
+    def _register_server_tools(self, server_name: str, server_config: dict, tools: List[dict], process):
+        """サーバーのツール一覧を登録（processがNoneの場合は未起動）"""
+        for tool in tools:
+            tool_key = f"{server_name}_{tool['name']}"
+            # 再接続時に定義が変わっていなければ変換済みのツール仕様を使い回す
+            previous = self.available_tools.get(tool_key)
+            if previous and previous.get("spec") and previous["tool"] == tool:
+                spec = previous["spec"]
+            else:
+                spec = _build_tool_spec(tool_key, tool)
+            self._register_tool(tool_key, {
+                "server": server_name,
+                "tool": tool,
+                "spec": spec,
+                "process": process,
+                "config": server_config,
+                "jsonrpc_mode": True
+            })
+            logger.info(f"ツール登録（JSON-RPC）: {tool_key} - {tool.get('description', '')}")
+
+    async def _start_server(self, server_name: str, server_config: dict):
+        """未起動または終了済みのサーバープロセスを起動（同時呼び出しでも起動は1回）"""
+        lock = self._start_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if self._closed:
+                raise Exception("MCPシステムは停止済みです")
+            process = self.server_processes.get(server_name)
+            if process is not None and process.returncode is None:
+                return  # 他の呼び出しで起動済み
+            if process is not None:
+                await self.disconnect_server(server_name)
+            logger.info(f"MCPサーバー '{server_name}' のプロセスを起動します")
+            # 初期化に応答しないサーバーで起動ロックを握り続けないよう、起動時と同じ上限を設ける
+            await asyncio.wait_for(
+                self._connect_server_jsonrpc(server_name, server_config),
+                timeout=CONNECT_TIMEOUT,
+            )
+
+    def _register_tool(self, tool_key: str, tool_info: dict):
+        """ツールを登録し、サーバーごとの索引も更新"""
+        self.available_tools[tool_key] = tool_info
+        self._tools_by_server.setdefault(tool_info["server"], set()).add(tool_key)
+
+    def _unregister_server_tools(self, server_name: str):
+        """サーバーのツールをすべて登録解除"""
+        for tool_key in self._tools_by_server.pop(server_name, ()):
+            self.available_tools.pop(tool_key, None)
+
+    def _ensure_reader(self, server_name: str, process):
+        """サーバーの応答読み取りタスクが動いていなければ開始"""
+        task = self._reader_tasks.get(server_name)
+        if task is None or task.done():
+            self._reader_tasks[server_name] = asyncio.create_task(self._read_loop(server_name, process))
+
+    def _fail_pending(self, server_name: str, error: BaseException):
+        """サーバーへの応答待ちリクエストをすべて失敗させる"""
+        pending = self._pending_requests.get(server_name)
+        if not pending:
+            return
+        futures = list(pending.values())
+        pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_loop(self, server_name: str, process):
+        """サーバーの応答を読み続け、リクエストIDに対応するFutureへ振り分ける"""
+        pending = self._pending_requests.setdefault(server_name, {})
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = _decode_message(line)
+                except json.JSONDecodeError as e:
+                    # どのリクエストへの応答か判別できないため、待機中のものをすべて失敗させる
+                    self._fail_pending(server_name, e)
+                    continue
+                
+                request_id = message.get("id") if isinstance(message, dict) else None
+                future = pending.pop(request_id, None)
+                if future is None:
+                    logger.debug("対応するリクエストがない応答を無視: %s - %s", server_name, message)
+                    continue
+                if not future.done():
+                    future.set_result(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._fail_pending(server_name, error or Exception("ツール実行応答がありません"))
+
     async def _execute_tool_jsonrpc(self, tool_info: dict, arguments: dict):
-        """JSON-RPC方式でのツール実行（直接JSON-RPC通信）"""
-        import time
+        """JSON-RPC方式でのツール実行（応答は読み取りタスク経由で受け取る）"""
         
         tool = tool_info["tool"]
         process = tool_info["process"]
+        server_name = tool_info["server"]
         
-        # tools/call リクエスト作成（動的なIDを使用）
-        request_id = int(time.time() * 1000) % 10000  # タイムスタンプベースのID
+        # tools/call リクエスト作成（プロセス内で一意なIDを使用）
+        request_id = next(self._request_ids)
         call_message = {
             "jsonrpc": "2.0",
             "id": request_id,
@@ -278,25 +649,23 @@ class MCPServerManager:
             }
         }
         
-        logger.debug(f"ツール実行リクエスト: {call_message}")
+        logger.debug("ツール実行リクエスト: %s", call_message)
+        
+        # 応答待ちを登録してから送信（同じサーバーへの複数リクエストを並行して処理できる）
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending_requests.setdefault(server_name, {})
+        pending[request_id] = future
+        self._ensure_reader(server_name, process)
         
         try:
-            # リクエスト送信
-            message_json = json.dumps(call_message) + "\n"
-            process.stdin.write(message_json.encode('utf-8'))
-            await process.stdin.drain()
+            # リクエスト送信（drainの同時待機を避けるためサーバーごとに直列化）
+            write_lock = self._write_locks.setdefault(server_name, asyncio.Lock())
+            async with write_lock:
+                await _send_message(process, _encode_message(call_message))
             
-            # 応答待機
-            response_line = await asyncio.wait_for(
-                process.stdout.readline(),
-                timeout=30.0  # ツール実行は時間がかかる可能性
-            )
-            
-            if not response_line:
-                raise Exception("ツール実行応答がありません")
-            
-            response = json.loads(response_line.decode('utf-8').strip())
-            logger.debug(f"ツール実行応答: {response}")
+            # 応答待機（ツール実行は時間がかかる可能性）
+            response = await asyncio.wait_for(future, timeout=TOOL_CALL_TIMEOUT)
+            logger.debug("ツール実行応答: %s", response)
             
             # エラーチェック
             if "error" in response:
@@ -328,29 +697,119 @@ class MCPServerManager:
         except json.JSONDecodeError as e:
             logger.error(f"MCPツール応答のJSON解析に失敗: {e}")
             raise Exception("ツール応答の解析に失敗しました")
+        finally:
+            pending.pop(request_id, None)
     
+    async def _terminate_process(self, server_name: str, process):
+        """サーバープロセスを終了（応じない場合は強制終了）し、標準入力を閉じる"""
+        if process.returncode is None:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass  # 既に終了している
+            try:
+                await asyncio.wait_for(process.wait(), timeout=PROCESS_TERMINATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # 終了要求に応じない場合は強制終了（ゾンビプロセスを残さない）
+                logger.warning(f"MCPサーバー '{server_name}' が終了しないため強制終了します")
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                await asyncio.wait_for(process.wait(), timeout=PROCESS_KILL_TIMEOUT)
+        
+        # パイプのファイルディスクリプタを早めに解放
+        stdin = process.stdin
+        if stdin is not None and not stdin.is_closing():
+            stdin.close()
+
+    async def _abort_process(self, server_name: str, process):
+        """接続に失敗したサーバープロセスを終了（終了処理の失敗で元のエラーを隠さない）"""
+        try:
+            await self._terminate_process(server_name, process)
+        except Exception as e:
+            logger.debug(f"プロセス終了エラー: {e}")
+
+    async def _stop_server_process(self, server_name: str):
+        """サーバープロセスと通信用のタスク・状態を破棄（ツール登録はそのまま）"""
+        # JSON-RPCプロセスをクリーンアップ
+        if server_name in self.server_processes:
+            process = self.server_processes[server_name]
+            try:
+                await self._terminate_process(server_name, process)
+            except Exception as e:
+                logger.debug(f"プロセス終了エラー: {e}")
+            del self.server_processes[server_name]
+        
+        # 応答読み取りタスクを停止し、応答待ちのリクエストを失敗させる
+        reader_task = self._reader_tasks.pop(server_name, None)
+        if reader_task and not reader_task.done():
+            reader_task.cancel()
+        self._write_locks.pop(server_name, None)
+        self._last_used.pop(server_name, None)
+        self._fail_pending(server_name, Exception(f"MCPサーバー '{server_name}' が切断されました"))
+        
+        # 起動中のサーバーがなくなればアイドル監視も停止
+        reaper_task = self._idle_reaper_task
+        if not self.server_processes and reaper_task and not reaper_task.done() and reaper_task is not asyncio.current_task():
+            reaper_task.cancel()
+
     async def _cleanup_server(self, server_name: str):
         """サーバーのクリーンアップ"""
         try:
-            # JSON-RPCプロセスをクリーンアップ
-            if server_name in self.server_processes:
-                process = self.server_processes[server_name]
-                try:
-                    if process.returncode is None:
-                        process.terminate()
-                        await asyncio.wait_for(process.wait(), timeout=3.0)
-                except Exception as e:
-                    logger.debug(f"プロセス終了エラー: {e}")
-                del self.server_processes[server_name]
+            await self._stop_server_process(server_name)
             
             # ツールを削除
-            to_remove = [key for key in self.available_tools.keys() 
-                        if key.startswith(f"{server_name}_")]
-            for key in to_remove:
-                del self.available_tools[key]
+            self._unregister_server_tools(server_name)
+            self._lazy_servers.discard(server_name)
                 
         except Exception as e:
             logger.error(f"サーバー '{server_name}' のクリーンアップに失敗: {e}")
+
+    def _server_idle_timeout(self, server_name: str) -> Optional[float]:
+        """サーバーをアイドル停止するまでの時間（Noneまたは0で停止しない）"""
+        timeout = self.servers_config.get(server_name, {}).get("idleTimeout", self._idle_timeout)
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            logger.warning(f"MCPサーバー '{server_name}' のidleTimeoutが数値ではないため既定値を使用します: {timeout}")
+            return self._idle_timeout
+        return timeout
+
+    def _ensure_idle_reaper(self):
+        """アイドルサーバーの停止タスクが動いていなければ開始"""
+        if not any(self._server_idle_timeout(server_name) for server_name in self.server_processes):
+            return
+        if self._idle_reaper_task is None or self._idle_reaper_task.done():
+            self._idle_reaper_task = asyncio.create_task(self._idle_reaper())
+
+    async def _idle_reaper(self):
+        """一定時間ツール実行のないサーバープロセスを定期的に停止"""
+        while self.server_processes:
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+            now = time.monotonic()
+            for server_name in list(self.server_processes.keys()):
+                idle_timeout = self._server_idle_timeout(server_name)
+                if not idle_timeout:
+                    continue  # このサーバーはアイドル停止しない
+                last_used = self._last_used.setdefault(server_name, now)
+                if now - last_used >= idle_timeout:
+                    await self._suspend_server(server_name)
+
+    async def _suspend_server(self, server_name: str):
+        """アイドル状態のサーバープロセスを停止し、次回実行時に再起動する状態にする"""
+        lock = self._start_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if server_name not in self.server_processes or self._pending_requests.get(server_name):
+                return  # 停止済み、または実行中のリクエストがある
+            logger.info(f"MCPサーバー '{server_name}' がアイドル状態のためプロセスを停止します")
+            try:
+                await self._stop_server_process(server_name)
+            except Exception as e:
+                logger.error(f"サーバー '{server_name}' の停止に失敗: {e}")
+            
+            # ツールは残し、プロセス未起動として扱う
+            for tool_key in self._tools_by_server.get(server_name, ()):
+                self.available_tools[tool_key]["process"] = None
+            self._lazy_servers.add(server_name)
     
     async def disconnect_server(self, server_name: str):
         """MCPサーバーから切断"""
@@ -359,20 +818,15 @@ class MCPServerManager:
             await self._cleanup_server(server_name)
             logger.info(f"MCPサーバー '{server_name}' を切断しました")
     
-    async def connect_all_servers(self):
-        """すべてのMCPサーバーに接続"""
-        if not self.servers_config:
-            logger.info("接続するMCPサーバーがありません")
-            return
-        
-        # 順次接続（並列接続でのタスクスコープの問題を回避）
-        for server_name, server_config in self.servers_config.items():
+    async def _connect_server_with_retry(self, server_name: str, server_config: dict, semaphore: asyncio.Semaphore):
+        """リトライ付きでMCPサーバーに接続（同時接続数はセマフォで制限）"""
+        async with semaphore:
             max_retries = 2
             for attempt in range(max_retries):
                 try:
                     await asyncio.wait_for(
                         self.connect_server(server_name, server_config),
-                        timeout=15.0
+                        timeout=CONNECT_TIMEOUT
                     )
                     break  # 成功したらループを抜ける
                 except asyncio.TimeoutError:
@@ -394,17 +848,33 @@ class MCPServerManager:
                         logger.debug(f"最終エラー詳細: {error_detail}")
                         final_failure_log = f"最終失敗: {server_name}サーバー - {e}\n試行回数: {max_retries}回\n詳細: {str(e)}\nトレース: {error_detail}"
                         self.tool_registration_log.append(final_failure_log)
+    
+    async def connect_all_servers(self):
+        """すべてのMCPサーバーに接続"""
+        if not self.servers_config:
+            logger.info("接続するMCPサーバーがありません")
+            return
         
-        # 接続されたサーバー数（JSON-RPCプロセスのみ）
-        connected_servers = set(self.server_processes.keys())
+        # 各サーバーは独立したプロセスのため並列に接続（同時起動数は制限）
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_CONNECTIONS)
+        await asyncio.gather(
+            *(
+                self._connect_server_with_retry(server_name, server_config, semaphore)
+                for server_name, server_config in self.servers_config.items()
+            ),
+            return_exceptions=True,
+        )
+        
+        # 接続されたサーバー数（起動済みと遅延起動のサーバー）
+        connected_servers = set(self.server_processes.keys()) | self._lazy_servers
         connected_count = len(connected_servers)
         total_tools = len(self.available_tools)
         logger.info(f"MCP接続完了: {connected_count}個のサーバー, {total_tools}個のツール")
         
         # 接続されたサーバーとツールの詳細をログ出力
         for server_name in connected_servers:
-            server_tools = [key for key in self.available_tools.keys() if key.startswith(f"{server_name}_")]
-            logger.info(f"  {server_name} (JSON-RPC): {len(server_tools)}個のツール")
+            tool_count = len(self._tools_by_server.get(server_name, ()))
+            logger.info(f"  {server_name} (JSON-RPC): {tool_count}個のツール")
         
         # 接続結果のサマリーをログに記録
         total_configured = len(self.servers_config)
@@ -429,9 +899,24 @@ class MCPServerManager:
         
         tool_info = self.available_tools[tool_key]
         server_name = tool_info["server"]
+        self._last_used[server_name] = time.monotonic()
         
+        # プロセスが未起動（遅延起動）または既に終了している場合は実行前に起動
+        process = tool_info["process"]
+        if process is None or process.returncode is not None:
+            try:
+                await self._start_server(server_name, tool_info["config"])
+            except Exception as e:
+                logger.error(f"MCPサーバー '{server_name}' の起動に失敗: {e}")
+                raise Exception(f"ツールの実行に失敗しました: {str(e)}")
+            if tool_key not in self.available_tools:
+                raise ValueError(f"ツール '{tool_key}' が見つかりません")
+            tool_info = self.available_tools[tool_key]
+        
+        # 実行中にアイドル停止などでtool_infoのプロセスが差し替えられても判定できるよう保持しておく
+        process = tool_info["process"]
         try:
-            logger.debug(f"MCPツール実行: {tool_key} with {arguments}")
+            logger.debug("MCPツール実行: %s with %s", tool_key, arguments)
             
             # JSON-RPC方式でツール実行
             result = await self._execute_tool_jsonrpc(tool_info, arguments)
@@ -440,35 +925,81 @@ class MCPServerManager:
         except Exception as e:
             logger.error(f"MCPツール '{tool_key}' の実行に失敗: {e}")
             
-            # プロセスが終了している場合は再接続を試行
-            if "broken" in str(e).lower() or "connection" in str(e).lower():
+            # プロセスが終了している場合のみ再接続を試行（ツール側のエラーでは接続を維持）
+            process_exited = process is None or process.returncode is not None
+            if isinstance(e, (BrokenPipeError, ConnectionResetError)) or process_exited:
                 logger.info(f"MCPサーバー '{server_name}' への再接続を試行します")
-                await self.disconnect_server(server_name)
-                server_config = tool_info["config"]
-                await self.connect_server(server_name, server_config)
+                await self._reconnect_server(server_name, tool_info["config"])
             
             raise Exception(f"ツールの実行に失敗しました: {str(e)}")
     
+    async def _reconnect_server(self, server_name: str, server_config: dict):
+        """サーバーを切断して再接続"""
+        await self.disconnect_server(server_name)
+        await self.connect_server(server_name, server_config)
+    
     async def disconnect_all_servers(self):
         """すべてのMCPサーバーを切断"""
-        disconnect_tasks = []
-        for server_name in list(self.server_processes.keys()):
-            task = self.disconnect_server(server_name)
-            disconnect_tasks.append(task)
+        self._closed = True
+        if self._idle_reaper_task and not self._idle_reaper_task.done():
+            self._idle_reaper_task.cancel()
+        
+        # 起動・停止処理中のサーバーは完了を待ってから切断対象に含める
+        starting = [lock for lock in self._start_locks.values() if lock.locked()]
+        if starting:
+            try:
+                await asyncio.wait_for(self._wait_for_starts(starting), timeout=DISCONNECT_ALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("起動処理中のMCPサーバーの完了を待てませんでした")
+        
+        # プロセス未起動（遅延起動・アイドル停止）のサーバーはツールの登録だけ解除
+        for server_name in self._lazy_servers:
+            self._unregister_server_tools(server_name)
+        self._lazy_servers.clear()
+        
+        processes = dict(self.server_processes)
+        disconnect_tasks = [
+            asyncio.ensure_future(self.disconnect_server(server_name))
+            for server_name in processes
+        ]
         
         if disconnect_tasks:
-            await asyncio.gather(*disconnect_tasks, return_exceptions=True)
+            # 呼び出し元がキャンセルされても、各プロセスの終了処理は最後まで実行させる
+            all_disconnected = asyncio.shield(asyncio.gather(*disconnect_tasks, return_exceptions=True))
+            try:
+                await asyncio.wait_for(all_disconnected, timeout=DISCONNECT_ALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                # 終了処理が滞っているサーバーはシャットダウンを止めないよう強制終了
+                for server_name, process in processes.items():
+                    if process.returncode is None:
+                        logger.warning(f"MCPサーバー '{server_name}' の切断がタイムアウトしたため強制終了します")
+                        try:
+                            process.kill()
+                        except ProcessLookupError:
+                            pass
             logger.info("すべてのMCPサーバーを切断しました")
     
+    @staticmethod
+    async def _wait_for_starts(locks: List[asyncio.Lock]):
+        """起動・停止処理中のサーバーのロックが解放されるまで待機"""
+        for lock in locks:
+            async with lock:
+                pass
+    
     def get_server_info(self):
         """サーバー情報を取得"""
         servers_info = {}
-        connected_servers = set(self.server_processes.keys())
+        connected_servers = set(self.server_processes.keys()) | self._lazy_servers
         
         for server_name in self.servers_config.keys():
             is_connected = server_name in connected_servers
-            tool_count = len([t for t in self.available_tools.keys() if t.startswith(f"{server_name}_")])
-            connection_type = "jsonrpc" if server_name in self.server_processes else "none"
+            tool_count = len(self._tools_by_server.get(server_name, ()))
+            if server_name in self.server_processes:
+                connection_type = "jsonrpc"
+            elif server_name in self._lazy_servers:
+                connection_type = "lazy"  # ツール登録済み・プロセス未起動
+            else:
+                connection_type = "none"
             
             servers_info[server_name] = {
                 "connected": is_connected,
@@ -488,6 +1019,58 @@ class MCPServerManager:
 mcp_manager = None
 _pending_mcp_init = None
 
+# 設定ディレクトリの探索結果とMCP設定ファイルの読み込みキャッシュ
+_resolved_config_dir: Optional[str] = None
+_mcp_config_cache: Dict[str, Tuple[int, dict]] = {}
+
+
+def _resolve_config_dir() -> str:
+    """設定ディレクトリを探索（結果はプロセス内でキャッシュ）"""
+    global _resolved_config_dir
+    if _resolved_config_dir is not None:
+        return _resolved_config_dir
+    
+    # config_loaderと同じ方法で設定ディレクトリを特定
+    # （実行ファイルの場所 → プロジェクトディレクトリ → その親 の順に setting.json を探す）
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if getattr(sys, "frozen", False):
+        # PyInstallerなどで固められたexeの場合
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        # 通常のPythonスクリプトとして実行された場合
+        base_dir = project_dir
+    
+    # 重複を除いた候補ディレクトリ（見つからない場合は最後の候補を使用）
+    candidates = list(dict.fromkeys(
+        os.path.join(d, "UserData") for d in (base_dir, project_dir, os.path.dirname(project_dir))
+    ))
+    config_dir = next(
+        (d for d in candidates if os.path.exists(os.path.join(d, "setting.json"))),
+        candidates[-1],
+    )
+    
+    _resolved_config_dir = config_dir
+    return config_dir
+
+
+def _load_mcp_config(mcp_config_path: str) -> dict:
+    """MCP設定ファイルを読み込む（更新時刻が変わっていなければキャッシュを返す）"""
+    try:
+        mtime_ns = os.stat(mcp_config_path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    
+    cached = _mcp_config_cache.get(mcp_config_path)
+    if cached is not None and mtime_ns is not None and cached[0] == mtime_ns:
+        return cached[1]
+    
+    with open(mcp_config_path, 'r', encoding='utf-8') as f:
+        config_data = json.load(f)
+    
+    if mtime_ns is not None:
+        _mcp_config_cache[mcp_config_path] = (mtime_ns, config_data)
+    return config_data
+
 
 def setup_mcp_tools(sts, config, cocoro_dock_client=None, config_dir=None):
     """MCPツールをセットアップ（JSON-RPC直接通信版）"""
@@ -497,28 +1080,7 @@ def setup_mcp_tools(sts, config, cocoro_dock_client=None, config_dir=None):
     if config_dir is None:
         config_dir = getattr(config, '_config_dir', None)
         if config_dir is None:
-            # config_loaderと同じ方法で設定ディレクトリを特定
-            import sys
-            if getattr(sys, "frozen", False):
-                # PyInstallerなどで固められたexeの場合
-                base_dir = os.path.dirname(sys.executable)
-            else:
-                # 通常のPythonスクリプトとして実行された場合
-                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            
-            config_dir = os.path.join(base_dir, "UserData")
-            
-            # 基本ディレクトリに設定ファイルがない場合は親ディレクトリを確認
-            setting_path = os.path.join(config_dir, "setting.json")
-            if not os.path.exists(setting_path):
-                parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                config_dir = os.path.join(parent_dir, "UserData")
-                
-                # 親ディレクトリに設定ファイルがない場合は親の親ディレクトリを確認
-                setting_path = os.path.join(config_dir, "setting.json")
-                if not os.path.exists(setting_path):
-                    grandparent_dir = os.path.dirname(parent_dir)
-                    config_dir = os.path.join(grandparent_dir, "UserData")
+            config_dir = _resolve_config_dir()
     
     try:
         # MCP設定ファイルを読み込み
@@ -528,8 +1090,7 @@ def setup_mcp_tools(sts, config, cocoro_dock_client=None, config_dir=None):
             logger.info("MCPサーバー設定ファイルが見つかりません: " + mcp_config_path)
             return ""
         
-        with open(mcp_config_path, 'r', encoding='utf-8') as f:
-            config_data = json.load(f)
+        config_data = _load_mcp_config(mcp_config_path)
         
         servers = config_data.get("mcpServers", {})
         
@@ -540,8 +1101,12 @@ def setup_mcp_tools(sts, config, cocoro_dock_client=None, config_dir=None):
         # 設定されたサーバー数をログ出力
         logger.info(f"MCP設定読み込み完了: {len(servers)}個のサーバー")
         
-        # MCPサーバーマネージャーの初期化
-        mcp_manager = MCPServerManager(servers)
+        # MCPサーバーマネージャーの初期化（アイドル停止時間は設定ファイルで変更可能、0で無効）
+        idle_timeout = config_data.get("idleTimeout", IDLE_SERVER_TIMEOUT)
+        if idle_timeout is not None and not isinstance(idle_timeout, (int, float)):
+            logger.warning(f"idleTimeoutが数値ではないため既定値を使用します: {idle_timeout}")
+            idle_timeout = IDLE_SERVER_TIMEOUT
+        mcp_manager = MCPServerManager(servers, config_dir, idle_timeout=idle_timeout)
         
         async def initialize_mcp_system():
             """MCPシステムを初期化"""
@@ -581,52 +1146,39 @@ def setup_mcp_tools(sts, config, cocoro_dock_client=None, config_dir=None):
         return ""
 
 
+def _make_tool_executor(manager: MCPServerManager, tool_key: str, cocoro_dock_client=None):
+    """MCPツールを実行する関数を作成
+
+    ツールキーはクロージャで固定し、引数として上書きされないようにする
+    """
+    status_message = f"MCPツール実行中: {tool_key}"
+
+    async def execute_mcp_tool(**kwargs):
+        """実際のMCPツールを実行"""
+        if cocoro_dock_client:
+            cocoro_dock_client.queue_status_update(status_message, status_type="mcp_executing")
+        
+        try:
+            result = await manager.execute_tool(tool_key, kwargs)
+            return result
+        except Exception as e:
+            logger.error(f"MCPツール '{tool_key}' の実行エラー: {e}")
+            return f"ツールの実行に失敗しました: {str(e)}"
+
+    return execute_mcp_tool
+
+
 async def register_dynamic_tools(sts, manager: MCPServerManager, cocoro_dock_client=None):
     """利用可能なMCPツールを動的に登録"""
     registered_count = 0
     
     for tool_key, tool_info in manager.available_tools.items():
-        tool = tool_info["tool"]
-        
-        # MCPツールの入力スキーマをAIAvatarKit形式に変換
-        # JSON-RPC方式では辞書形式でツール情報が返される
-        parameters = tool.get('inputSchema', {
-            "type": "object",
-            "properties": {},
-            "required": []
-        })
-        description = tool.get('description', '')
-        
-        tool_spec = {
-            "type": "function",
-            "function": {
-                "name": tool_key,
-                "description": description,
-                "parameters": parameters
-            }
-        }
-        
-        # 動的ツール実行関数を作成
-        async def execute_mcp_tool(tool_name=tool_key, **kwargs):
-            """実際のMCPツールを実行"""
-            if cocoro_dock_client:
-                asyncio.create_task(
-                    cocoro_dock_client.send_status_update(
-                        f"MCPツール実行中: {tool_name}", 
-                        status_type="mcp_executing"
-                    )
-                )
-            
-            try:
-                result = await manager.execute_tool(tool_name, kwargs)
-                return result
-            except Exception as e:
-                logger.error(f"MCPツール '{tool_name}' の実行エラー: {e}")
-                return f"ツールの実行に失敗しました: {str(e)}"
+        # MCPツールの入力スキーマをAIAvatarKit形式に変換（登録時に変換済みならそれを使う）
+        tool_spec = tool_info.get("spec") or _build_tool_spec(tool_key, tool_info["tool"])
         
         # AIAvatarKitにツールを登録
         try:
-            sts.llm.tool(tool_spec)(execute_mcp_tool)
+            sts.llm.tool(tool_spec)(_make_tool_executor(manager, tool_key, cocoro_dock_client))
             registered_count += 1
             log_message = f"登録成功: {tool_key} ({tool_info['server']}サーバー)"
             logger.debug(f"ツール登録成功: {tool_key}")
@@ -636,8 +1188,8 @@ async def register_dynamic_tools(sts, manager: MCPServerManager, cocoro_dock_cli
             error_detail = traceback.format_exc()
             log_message = f"登録失敗: {tool_key} - {e}\n詳細: {str(e)}\nトレース: {error_detail}"
             logger.error(f"ツール登録失敗: {tool_key} - {e}")
-            logger.debug(f"tool_spec: {tool_spec}")
-            logger.debug(f"tool info: {tool_info}")
+            logger.debug("tool_spec: %s", tool_spec)
+            logger.debug("tool info: %s", tool_info)
             logger.debug(f"エラー詳細: {error_detail}")
             manager.tool_registration_log.append(log_message)
     
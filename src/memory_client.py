@@ -1,14 +1,73 @@
 """ChatMemoryサービスとの通信を管理するクライアント"""
 
 import asyncio
+import json
 import logging
+import random
+import re
+import time
+from collections import OrderedDict
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import httpx
 
+try:
+    import orjson
+except ImportError:  # orjsonは任意依存（未インストール時はhttpx標準のJSONエンコードを使用）
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 履歴保存をまとめる待ち時間（秒）: この間に続いた保存要求は1回のPOSTにまとめる
+HISTORY_FLUSH_DELAY = 0.2
+
+# 履歴保存の再試行（タイムアウト・5xxなど一時的な失敗のみ、指数バックオフ＋ジッター）
+HISTORY_RETRY_ATTEMPTS = 3
+HISTORY_RETRY_BASE_DELAY = 0.5
+HISTORY_RETRY_MAX_DELAY = 10.0
+
+# クライアント終了時に送信中の履歴保存を待つ上限（秒）: 超えた分は中断してシャットダウンを止めない
+CLOSE_FLUSH_TIMEOUT = 3.0
+
+# エンドポイント別のタイムアウト（秒）
+# 記憶検索は埋め込み生成とベクトル検索で数秒かかることがあるため長めに、書き込みは早めに失敗させる
+# 要約生成はサーバー側でLLMを呼ぶため最も長くする
+SEARCH_TIMEOUT = httpx.Timeout(20.0, connect=2.0)
+HISTORY_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+KNOWLEDGE_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+SUMMARY_TIMEOUT = httpx.Timeout(30.0, connect=2.0)
+
+# 記憶検索結果のキャッシュ（同じクエリの再検索を省く）
+# 直前の会話はLLMのコンテキストに含まれるため、履歴保存では破棄せず有効期限で鮮度を保つ
+SEARCH_CACHE_TTL = 600.0
+SEARCH_CACHE_MAX_ENTRIES = 128
+
+# 保存に失敗して戻したメッセージを保持する上限（超えた分は古いものから破棄）
+MAX_QUEUED_MESSAGES = 1000
+
+# メッセージ種別を判定するタグ
+NOTIFICATION_TAG = "<cocoro-notification>"
+DESKTOP_MONITORING_TAG = "<cocoro-desktop-monitoring>"
+
+# 通知タグ内のJSONを抽出するパターン
+_NOTIFICATION_PATTERN = re.compile(r"<cocoro-notification>\s*(.*?)\s*</cocoro-notification>", re.DOTALL)
+
+# 画像プレフィックスのパターン（複数の形式を1つの正規表現にまとめて1回で照合する）
+_IMAGE_PREFIX_PATTERN = re.compile(
+    r"^(?:"
+    r"\[画像を共有しました: .+?\]"
+    r"|\[画像: .+?\]"
+    r"|\[\d+枚の画像: .+?\]"
+    # 通知の画像パターン
+    r"|\[.+?から画像付き通知: .+?\]"
+    r"|\[.+?から\d+枚の画像付き通知: .+?\]"
+    r")(?:\n(.+))?$",
+    re.DOTALL,
+)
+
 
 class MessageType(Enum):
     """メッセージタイプの定義"""
@@ -25,9 +84,31 @@ class ChatMemoryClient:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
         # 非同期化したので通常のタイムアウト設定に戻す
-        self.client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=3.0))
+        # 同じChatMemoryへの短いリクエストが続くため、接続を保持して再利用する
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_keepalive_connections=5, max_connections=10, keepalive_expiry=60.0),
+            http2=False,  # ローカル接続なのでHTTP/1.1で十分
+        )
+        # キュー操作の間にawaitを挟まないため、イベントループ上ではロックなしで一貫性が保たれる
         self._message_queue: List[Dict] = []
-        self._queue_lock = asyncio.Lock()
+        # 送信待ちの履歴保存タスクと、送信先 (user_id, session_id, channel) ごとの送信待ちメッセージ
+        self._pending_flush: Optional[asyncio.Task] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._flush_batches: Dict[Tuple[str, str, str], List[Dict]] = {}
+        # (user_id, 正規化したクエリ, top_k) → (取得時刻, 検索結果) のLRUキャッシュ
+        self._search_cache: OrderedDict[Tuple[str, str, int], Tuple[float, dict]] = OrderedDict()
+        # ユーザーごとのキャッシュ世代（破棄のたびに進め、破棄前に始まった検索の結果を保存しない）
+        self._search_generations: Dict[str, int] = {}
+        # 同じキーで実行中の記憶検索（同時に来た同一検索は1回の要求にまとめる）
+        self._search_pending: Dict[Tuple[str, str, int], asyncio.Future] = {}
+        self._closed = False
+        # メッセージタイプ別の保存処理
+        self._handlers = {
+            MessageType.USER_CHAT: self._handle_user_chat_message,
+            MessageType.NOTIFICATION: self._handle_notification_message,
+            MessageType.DESKTOP_MONITORING: self._handle_desktop_monitoring_message,
+        }
 
     async def enqueue_messages(self, request, response):
         """メッセージタイプに応じた適切な保存処理"""
@@ -36,36 +117,37 @@ class ChatMemoryClient:
             logger.debug(f"空のレスポンスをスキップ: assistant_content={response.text}")
             return
 
-        async with self._queue_lock:
-            # メッセージタイプを判定
-            message_type = self._determine_message_type(request)
+        # 各メッセージに共通するメタデータは1回だけ構築する
+        base_metadata = {"session_id": request.session_id, "user_id": request.user_id}
 
-            # タイプ別処理
-            if message_type == MessageType.NOTIFICATION:
-                await self._handle_notification_message(request, response)
-            elif message_type == MessageType.DESKTOP_MONITORING:
-                await self._handle_desktop_monitoring_message(request, response)
-            else:  # MessageType.USER_CHAT
-                await self._handle_user_chat_message(request, response)
+        # メッセージタイプを判定し、タイプ別の処理を実行
+        message_type = self._determine_message_type(request)
+        await self._handlers[message_type](request, response, base_metadata)
 
     def _determine_message_type(self, request: Any) -> MessageType:
         """リクエストからメッセージタイプを判定"""
         request_text = request.text or ""
 
+        # タグを含まない通常のチャットは1回の走査で判定を終える
+        if "<" not in request_text:
+            return MessageType.USER_CHAT
+
         # 優先順位1: 通知メッセージ
-        if "<cocoro-notification>" in request_text:
+        if NOTIFICATION_TAG in request_text:
             return MessageType.NOTIFICATION
 
         # 優先順位2: デスクトップモニタリング
-        if "<cocoro-desktop-monitoring>" in request_text:
+        if DESKTOP_MONITORING_TAG in request_text:
             return MessageType.DESKTOP_MONITORING
 
         # 優先順位3: 通常のユーザーチャット
         return MessageType.USER_CHAT
 
-    async def _handle_notification_message(self, request: Any, response: Any) -> None:
+    async def _handle_notification_message(
+        self, request: Any, response: Any, base_metadata: Dict[str, Any]
+    ) -> None:
         """通知メッセージの処理"""
-        user_metadata = self._build_user_metadata(request)
+        user_metadata = self._build_user_metadata(request, base_metadata)
 
         # 通知タグから情報を直接抽出
         notification_info = self._extract_notification_info(request.text or "")
@@ -73,8 +155,8 @@ class ChatMemoryClient:
         notification_message = notification_info.get("message", "")
 
         # 画像付き通知の場合
-        if user_metadata.get("image_description"):
-            image_info = user_metadata["image_description"]
+        image_info = user_metadata.get("image_description")
+        if image_info:
             classification = self._build_classification(user_metadata)
 
             content = f"[画像付き通知: {notification_from}] {notification_message}\n[画像内容: {image_info}]{classification}"
@@ -93,76 +175,56 @@ class ChatMemoryClient:
         )
 
         # アシスタントの応答を追加
-        self._add_assistant_response(request, response)
+        self._add_assistant_response(response, base_metadata)
 
-    async def _handle_desktop_monitoring_message(self, request: Any, response: Any) -> None:
+    async def _handle_desktop_monitoring_message(
+        self, request: Any, response: Any, base_metadata: Dict[str, Any]
+    ) -> None:
         """デスクトップモニタリングメッセージの処理"""
-        user_metadata = self._build_user_metadata(request)
+        user_metadata = self._build_user_metadata(request, base_metadata)
 
         # 画像説明が必須
         if not user_metadata.get("image_description"):
             logger.warning("デスクトップモニタリングに画像説明がありません")
             return
 
-        image_info = user_metadata["image_description"]
-        classification = self._build_classification(user_metadata)
-
         # systemロールで画像説明のみ保存
         self._message_queue.append(
-            {
-                "role": "system",
-                "content": f"[画像が共有されました: {image_info}]{classification}",
-                "metadata": {
-                    "session_id": request.session_id,
-                    "user_id": request.user_id,
-                    "type": "image_description",
-                    "image_category": user_metadata.get("image_category", ""),
-                    "image_mood": user_metadata.get("image_mood", ""),
-                    "image_time": user_metadata.get("image_time", ""),
-                },
-            }
+            self._build_image_description_message(base_metadata, user_metadata)
         )
 
         logger.info("デスクトップモニタリング画像説明をシステムメッセージとして履歴に追加")
 
         # userメッセージは保存しない
         # アシスタントの応答を追加
-        self._add_assistant_response(request, response)
+        self._add_assistant_response(response, base_metadata)
 
-    async def _handle_user_chat_message(self, request: Any, response: Any) -> None:
+    async def _handle_user_chat_message(
+        self, request: Any, response: Any, base_metadata: Dict[str, Any]
+    ) -> None:
         """通常のユーザーチャットメッセージの処理"""
+        # リクエストの属性は一度だけ読み出す
+        text = request.text
+
         # request.textが空の場合はスキップ
-        if not request.text:
+        if not text:
             logger.debug("空のユーザーメッセージをスキップ")
             return
 
-        user_metadata = self._build_user_metadata(request)
+        user_metadata = self._build_user_metadata(request, base_metadata)
 
         # 画像がある場合
-        if user_metadata.get("image_description"):
+        image_info = user_metadata.get("image_description")
+        if image_info:
             # 画像説明をsystemロールで保存
-            image_info = user_metadata["image_description"]
-            classification = self._build_classification(user_metadata)
-
             self._message_queue.append(
-                {
-                    "role": "system",
-                    "content": f"[画像が共有されました: {image_info}]{classification}",
-                    "metadata": {
-                        "session_id": request.session_id,
-                        "user_id": request.user_id,
-                        "type": "image_description",
-                        "image_category": user_metadata.get("image_category", ""),
-                        "image_mood": user_metadata.get("image_mood", ""),
-                        "image_time": user_metadata.get("image_time", ""),
-                    },
-                }
+                self._build_image_description_message(base_metadata, user_metadata)
             )
 
             logger.info(f"画像説明をシステムメッセージとして履歴に追加: {image_info[:30]}...")
 
             # 画像プレフィックスを除去してuserメッセージを保存
-            cleaned_text = self._remove_image_prefix(request.text)
+            cleaned_text = self._remove_image_prefix(text)
             if cleaned_text:
                 self._message_queue.append(
                     {
@@ -176,37 +238,40 @@ class ChatMemoryClient:
             self._message_queue.append(
                 {
                     "role": "user",
-                    "content": request.text,
+                    "content": text,
                     "metadata": user_metadata,
                 }
             )
 
         # アシスタントの応答を追加
-        self._add_assistant_response(request, response)
+        self._add_assistant_response(response, base_metadata)
 
-    def _build_user_metadata(self, request: Any) -> Dict[str, Any]:
-        """ユーザーメタデータを構築"""
-        user_metadata = {"session_id": request.session_id, "user_id": request.user_id}
+    def _build_user_metadata(self, request: Any, base_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """ユーザーメタデータを構築（共通メタデータを複製して拡張）"""
+        user_metadata = dict(base_metadata)
         if hasattr(request, "metadata") and request.metadata:
             user_metadata.update(request.metadata)
         return user_metadata
 
     def _extract_notification_info(self, text: str) -> Dict[str, str]:
-        """通知タグからJSON形式の情報を抽出"""
-        import re
-        import json
+        """通知タグからJSON形式の情報を抽出
 
-        if not text or "<cocoro-notification>" not in text:
+        タグの有無は_determine_message_typeで確認済みのため、ここでは正規表現の検索のみ行う
+        （タグがなければ検索結果がNoneになる）
+        """
+        if not text:
             return {}
 
-        notification_pattern = r"<cocoro-notification>\s*(.*?)\s*</cocoro-notification>"
-        match = re.search(notification_pattern, text, re.DOTALL)
+        match = _NOTIFICATION_PATTERN.search(text)
 
         if match:
-            content = match.group(1).strip()
+            # 前後の空白はパターン側で除いているためstripは不要
+            content = match.group(1)
             try:
+                if orjson is not None:
+                    return orjson.loads(content)
                 return json.loads(content)
-            except Exception as e:
+            except ValueError as e:  # orjson.JSONDecodeErrorもValueErrorのサブクラス
                 logger.error(f"通知JSON解析エラー: {e}")
                 return {}
 
@@ -222,82 +287,232 @@ class ChatMemoryClient:
             return f" (分類: {category}/{mood}/{time})"
         return ""
 
-    def _add_assistant_response(self, request: Any, response: Any) -> None:
-        """アシスタントの応答を追加"""
+    def _build_image_description_message(
+        self, base_metadata: Dict[str, Any], user_metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """画像説明のsystemメッセージを構築"""
+        image_info = user_metadata["image_description"]
+        classification = self._build_classification(user_metadata)
+        return {
+            "role": "system",
+            "content": f"[画像が共有されました: {image_info}]{classification}",
+            "metadata": {
+                **base_metadata,
+                "type": "image_description",
+                "image_category": user_metadata.get("image_category", ""),
+                "image_mood": user_metadata.get("image_mood", ""),
+                "image_time": user_metadata.get("image_time", ""),
+            },
+        }
+
+    def _add_assistant_response(self, response: Any, base_metadata: Dict[str, Any]) -> None:
+        """アシスタントの応答を追加（共通メタデータはこのメッセージが引き取る）"""
         self._message_queue.append(
             {
                 "role": "assistant",
                 "content": response.text,
-                "metadata": {"session_id": request.session_id, "user_id": request.user_id},
+                "metadata": base_metadata,
             }
         )
 
     def _remove_image_prefix(self, text: str) -> str:
         """画像プレフィックスを除去"""
-        import re
-
-        # 複数のパターンに対応
-        patterns = [
-            r"^\[画像を共有しました: .+?\](?:\n(.+))?$",
-            r"^\[画像: .+?\](?:\n(.+))?$",
-            r"^\[\d+枚の画像: .+?\](?:\n(.+))?$",
-            # 通知の画像パターンも追加
-            r"^\[.+?から画像付き通知: .+?\](?:\n(.+))?$",
-            r"^\[.+?から\d+枚の画像付き通知: .+?\](?:\n(.+))?$",
-        ]
-
-        for pattern in patterns:
-            match = re.match(pattern, text, re.DOTALL)
-            if match:
-                return match.group(1) or ""
-
+        match = _IMAGE_PREFIX_PATTERN.match(text)
+        if match:
+            return match.group(1) or ""
         return text
 
+    async def _post_json(
+        self, url: str, payload: Dict[str, Any], timeout: Any = httpx.USE_CLIENT_DEFAULT
+    ) -> httpx.Response:
+        """JSONボディでPOST（orjsonがあればUTF-8のままシリアライズし、エスケープを省く）"""
+        if orjson is not None:
+            return await self.client.post(
+                url, content=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=timeout
+            )
+        return await self.client.post(url, json=payload, timeout=timeout)
+
+    @staticmethod
+    def _parse_json(response: httpx.Response) -> Any:
+        """レスポンスボディをJSONとして解析"""
+        if orjson is not None:
+            return orjson.loads(response.content)
+        return response.json()
+
     async def save_history(self, user_id: str, session_id: str, channel: str = "cocoro_ai"):
-        """キューに溜まったメッセージを履歴として保存"""
-        async with self._queue_lock:
-            if not self._message_queue:
-                return
+        """キューに溜まったメッセージを履歴として保存
 
-            messages = self._message_queue.copy()
-            self._message_queue.clear()
+        その時点でキューにあるメッセージを送信先に割り当て、短時間に続いた保存要求は
+        1つのバックグラウンドタスクにまとめて送信先ごとに1回ずつPOSTする。
+        呼び出し元がキャンセルされても保存処理は継続する。
+        """
+        if not self._message_queue:
+            return
 
+        # キューを新しいリストと差し替えて丸ごと引き取る（コピー不要）
+        messages = self._message_queue
+        self._message_queue = []
+        target = (user_id, session_id, channel)
+        batch = self._flush_batches.get(target)
+        if batch is None:
+            self._flush_batches[target] = messages
+        else:
+            batch.extend(messages)
+
+        task = self._pending_flush
+        if task is None:
+            task = asyncio.create_task(self._flush_history())
+            self._pending_flush = task
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        await asyncio.shield(task)
+
+    async def _flush_history(self):
+        """待ち時間の後、送信先ごとにまとめたメッセージを送信"""
+        await asyncio.sleep(HISTORY_FLUSH_DELAY)
+        # ここから先の保存要求は次のタスクで送信する
+        self._pending_flush = None
+        batches = self._flush_batches
+        self._flush_batches = {}
+
+        failed: List[Dict] = []
+        for target, messages in batches.items():
+            if not await self._send_history(target, messages):
+                failed.extend(messages)
+        # 送信に失敗したメッセージは元の順序のままキューに戻す
+        if failed:
+            self._requeue_messages(failed)
+
+    async def _send_history(self, target: Tuple[str, str, str], messages: List[Dict]) -> bool:
+        """1つの送信先の履歴を送信（再送すべき失敗の場合はFalseを返す）"""
+        user_id, session_id, channel = target
         try:
-            response = await self.client.post(
-                f"{self.base_url}/history",
-                json={
+            await self._post_history(
+                {
                     "user_id": user_id,
                     "session_id": session_id,
                     "channel": channel,
                     "messages": messages,
-                },
+                }
             )
-            response.raise_for_status()
             logger.info(f"履歴を保存しました: {len(messages)}件のメッセージ")
         except httpx.ConnectError:
             logger.debug("ChatMemory未起動。処理を継続します。")
-            # 失敗したメッセージをキューに戻す
-            async with self._queue_lock:
-                self._message_queue = messages + self._message_queue
+            return False
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500:
+                # リクエスト自体が受け付けられないため、再送せずに破棄する
+                logger.error(f"履歴の保存が拒否されたため破棄します: {len(messages)}件のメッセージ - {e}")
+                return True
+            logger.error(f"履歴の保存に失敗しました: {e}")
+            return False
         except Exception as e:
             logger.error(f"履歴の保存に失敗しました: {e}")
-            # 失敗したメッセージをキューに戻す
-            async with self._queue_lock:
-                self._message_queue = messages + self._message_queue
+            return False
+        return True
+
+    async def _post_history(self, payload: Dict[str, Any]) -> None:
+        """履歴をPOST（タイムアウトと5xxは指数バックオフで再試行、終了中は再試行しない）"""
+        for attempt in range(HISTORY_RETRY_ATTEMPTS):
+            try:
+                response = await self._post_json(f"{self.base_url}/history", payload, timeout=HISTORY_TIMEOUT)
+                response.raise_for_status()
+                return
+            except (httpx.TimeoutException, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                # クライアント終了中は再試行せず、シャットダウンを待たせない
+                if not retryable or self._closed or attempt == HISTORY_RETRY_ATTEMPTS - 1:
+                    raise
+                delay = min(HISTORY_RETRY_BASE_DELAY * 2**attempt, HISTORY_RETRY_MAX_DELAY)
+                delay += random.uniform(0, HISTORY_RETRY_BASE_DELAY)
+                logger.debug(f"履歴の保存を再試行します（{attempt + 1}回目の失敗: {e}、{delay:.1f}秒後）")
+                await asyncio.sleep(delay)
+
+    def _requeue_messages(self, messages: List[Dict]) -> None:
+        """送信に失敗したメッセージをキューの先頭に戻す（上限を超えた分は古いものから破棄）"""
+        self._message_queue[:0] = messages
+        overflow = len(self._message_queue) - MAX_QUEUED_MESSAGES
+        if overflow > 0:
+            del self._message_queue[:overflow]
+            logger.warning(f"未保存の履歴が上限を超えたため古いメッセージを破棄しました: {overflow}件")
 
     async def search(self, user_id: str, query: str, top_k: int = 5) -> Optional[dict]:
-        """記憶検索（高速）"""
+        """記憶検索（高速）
+
+        有効期限内に同じクエリで検索済みの場合はキャッシュした結果を返し、
+        同じクエリの検索が実行中の場合はその結果を共有する
+        """
+        key = (user_id, query.strip().lower(), top_k)
+        cached = self._get_cached_search(key)
+        if cached is not None:
+            logger.debug(f"記憶検索キャッシュを使用: {query}")
+            return cached
+
+        pending = self._search_pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._search_and_cache(key, user_id, query, top_k))
+            self._search_pending[key] = pending
+            pending.add_done_callback(lambda done: self._forget_pending_search(key, done))
+        else:
+            logger.debug(f"実行中の記憶検索を共有: {query}")
+        # 待機側がキャンセルされても共有中の検索は継続させる
+        return await asyncio.shield(pending)
+
+    async def _search_and_cache(
+        self, key: Tuple[str, str, int], user_id: str, query: str, top_k: int
+    ) -> Optional[dict]:
+        """記憶検索を実行して結果をキャッシュに保存"""
+        generation = self._search_generations.get(user_id, 0)
+        result = await self._search_remote(user_id, query, top_k)
+        # 失敗結果はChatMemoryの一時的な状態の可能性があるためキャッシュしない
+        # 検索中に記憶が更新された場合も、古い内容の可能性があるためキャッシュしない
+        if result is not None and self._search_generations.get(user_id, 0) == generation:
+            self._search_cache[key] = (time.monotonic(), result)
+            self._search_cache.move_to_end(key)
+            if len(self._search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+                self._search_cache.popitem(last=False)
+        return result
+
+    def _get_cached_search(self, key: Tuple[str, str, int]) -> Optional[dict]:
+        """有効期限内の検索結果キャッシュを取得"""
+        entry = self._search_cache.get(key)
+        if entry is None:
+            return None
+        cached_at, result = entry
+        if time.monotonic() - cached_at > SEARCH_CACHE_TTL:
+            del self._search_cache[key]
+            return None
+        self._search_cache.move_to_end(key)
+        return result
+
+    def _forget_pending_search(self, key: Tuple[str, str, int], done: asyncio.Future) -> None:
+        """完了した検索を実行中の一覧から外す（破棄後に始まった同じキーの検索は残す）"""
+        if self._search_pending.get(key) is done:
+            del self._search_pending[key]
+
+    def _invalidate_search_cache(self, user_id: str) -> None:
+        """ユーザーの検索結果キャッシュを破棄（記憶の内容が変わった場合）"""
+        self._search_generations[user_id] = self._search_generations.get(user_id, 0) + 1
+        for key in [key for key in self._search_cache if key[0] == user_id]:
+            del self._search_cache[key]
+        # 実行中の検索は続けるが、以降の同じ検索は新しい要求として扱う
+        for key in [key for key in self._search_pending if key[0] == user_id]:
+            del self._search_pending[key]
+
+    async def _search_remote(self, user_id: str, query: str, top_k: int) -> Optional[dict]:
+        """ChatMemoryに記憶検索を要求"""
         try:
-            response = await self.client.post(
+            response = await self._post_json(
                 f"{self.base_url}/search_direct",
-                json={
+                {
                     "user_id": user_id,
                     "query": query,
                     "top_k": top_k,
                 },
+                timeout=SEARCH_TIMEOUT,
             )
             response.raise_for_status()
-            result = response.json()
+            result = self._parse_json(response)
 
             if "error" in result:
                 logger.error(f"記憶検索エラー: {result['error']}")
@@ -318,8 +533,11 @@ class ChatMemoryClient:
             if session_id:
                 params["session_id"] = session_id
 
-            response = await self.client.post(f"{self.base_url}/summary/create", params=params)
+            response = await self.client.post(
+                f"{self.base_url}/summary/create", params=params, timeout=SUMMARY_TIMEOUT
+            )
             response.raise_for_status()
+            self._invalidate_search_cache(user_id)
             logger.info(f"要約を生成しました: user_id={user_id}, session_id={session_id}")
         except Exception as e:
             logger.error(f"要約の生成に失敗しました: {e}")
@@ -327,18 +545,38 @@ class ChatMemoryClient:
     async def add_knowledge(self, user_id: str, knowledge: str):
         """ユーザーの知識（固有名詞、記念日など）を追加"""
         try:
-            response = await self.client.post(
+            response = await self._post_json(
                 f"{self.base_url}/knowledge",
-                json={
+                {
                     "user_id": user_id,
                     "knowledge": knowledge,
                 },
+                timeout=KNOWLEDGE_TIMEOUT,
             )
             response.raise_for_status()
+            self._invalidate_search_cache(user_id)
             logger.info(f"ナレッジを追加しました: {knowledge}")
         except Exception as e:
             logger.error(f"ナレッジの追加に失敗しました: {e}")
 
     async def close(self):
-        """クライアントを閉じる"""
+        """クライアントを閉じる（複数回呼ばれても2回目以降は何もしない）"""
+        if self._closed:
+            return
+        self._closed = True
+        # 送信待ち・送信中の履歴保存を終えてから閉じる（上限時間を超えたものは中断）
+        if self._flush_tasks:
+            tasks = list(self._flush_tasks)
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*tasks, return_exceptions=True), timeout=CLOSE_FLUSH_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning("履歴の保存が終わらないため中断してクライアントを閉じます")
         await self.client.aclose()
+
+    async def __aenter__(self) -> "ChatMemoryClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
@@ -154,6 +154,28 @@ class TestCocoroDockClient(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(payload['message'], "処理中")
         self.assertEqual(payload['type'], "processing")
 
+    async def test_queue_status_update_coalesces_burst(self):
+        """連続したステータス更新が最新のものにまとめられることのテスト"""
+        sent = []
+
+        async def send_status_update(message, status_type=None):
+            sent.append((message, status_type))
+            return True
+
+        self.client.send_status_update = send_status_update
+
+        self.client.queue_status_update("ツール1", "mcp_executing")
+        self.client.queue_status_update("ツール2", "mcp_executing")
+        self.client.queue_status_update("ツール3", "mcp_executing")
+        await self.client._status_task
+
+        self.assertEqual(sent, [("ツール3", "mcp_executing")])
+
+        # 送信完了後の更新は新たに送信される
+        self.client.queue_status_update("記憶検索中", "memory_accessing")
+        await self.client._status_task
+        self.assertEqual(sent[-1], ("記憶検索中", "memory_accessing"))
+
     async def test_close(self):
         """クライアント終了のテスト"""
         # closeメソッドをモック
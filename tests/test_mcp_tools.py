@@ -56,12 +56,12 @@ class TestMCPServerManager:
     def test_get_server_info_with_tools(self):
         """ツールありでのサーバー情報取得テスト"""
         # 手動でツールを追加
-        self.manager.available_tools["test-server_sample_tool"] = {
+        self.manager._register_tool("test-server_sample_tool", {
             "server": "test-server",
             "tool": {"name": "sample_tool"},
             "config": self.servers_config["test-server"],
             "jsonrpc_mode": True
-        }
+        })
         
         info = self.manager.get_server_info()
         
@@ -80,13 +80,13 @@ class TestMCPServerManager:
         
         # プロセスとツールを手動で設定
         self.manager.server_processes["test-server"] = mock_process
-        self.manager.available_tools["test-server_test_tool"] = {
+        self.manager._register_tool("test-server_test_tool", {
             "server": "test-server",
             "tool": {"name": "test_tool"},
             "process": mock_process,
             "config": self.servers_config["test-server"],
             "jsonrpc_mode": True
-        }
+        })
         
         # クリーンアップ実行
         await self.manager._cleanup_server("test-server")
@@ -98,7 +98,218 @@ class TestMCPServerManager:
         # データが削除されたことを確認
         assert "test-server" not in self.manager.server_processes
         assert "test-server_test_tool" not in self.manager.available_tools
-    
+
+    @pytest.mark.asyncio
+    async def test_cleanup_server_keeps_tools_of_prefixed_server(self):
+        """名前が前方一致する別サーバーのツールを削除しないことのテスト"""
+        self.manager._register_tool("fs_read", {"server": "fs", "tool": {"name": "read"}})
+        self.manager._register_tool("fs_extra_read", {"server": "fs_extra", "tool": {"name": "read"}})
+
+        await self.manager._cleanup_server("fs")
+
+        assert list(self.manager.available_tools) == ["fs_extra_read"]
+        assert self.manager._tools_by_server == {"fs_extra": {"fs_extra_read"}}
+
+    @pytest.mark.asyncio
+    async def test_cleanup_server_kills_unresponsive_process(self):
+        """終了要求に応じないプロセスを強制終了するテスト"""
+        mock_process = MagicMock()
+        mock_process.returncode = None
+        mock_process.wait = AsyncMock(side_effect=[asyncio.TimeoutError(), 0])
+        mock_process.kill.side_effect = ProcessLookupError()
+        mock_process.stdin.is_closing.return_value = False
+        self.manager.server_processes["test-server"] = mock_process
+
+        await self.manager._cleanup_server("test-server")
+
+        mock_process.terminate.assert_called_once()
+        mock_process.kill.assert_called_once()
+        assert mock_process.wait.call_count == 2
+        mock_process.stdin.close.assert_called_once()
+        assert "test-server" not in self.manager.server_processes
+
+    @pytest.mark.asyncio
+    async def test_idle_server_is_suspended_and_keeps_tools(self):
+        """アイドル状態のサーバーはプロセスのみ停止し、ツールは残すことのテスト"""
+        manager = MCPServerManager(self.servers_config, idle_timeout=0.01)
+        mock_process = MagicMock()
+        mock_process.returncode = None
+        mock_process.wait = AsyncMock(return_value=0)
+        manager.server_processes["test-server"] = mock_process
+        manager._register_server_tools("test-server", self.servers_config["test-server"], [{"name": "echo"}], mock_process)
+
+        with patch('mcp_tools.IDLE_CHECK_INTERVAL', 0.01):
+            manager._ensure_idle_reaper()
+            await asyncio.wait_for(manager._idle_reaper_task, timeout=1.0)
+
+        mock_process.terminate.assert_called_once()
+        assert manager.server_processes == {}
+        assert manager.available_tools["test-server_echo"]["process"] is None
+        assert manager.get_server_info()["servers"]["test-server"]["connection_type"] == "lazy"
+
+    @pytest.mark.asyncio
+    async def test_idle_timeout_can_be_disabled_per_server(self):
+        """サーバー設定のidleTimeoutが0の場合はアイドル停止しないことのテスト"""
+        servers_config = {
+            "stateful": dict(self.servers_config["test-server"], idleTimeout=0),
+            "short": dict(self.servers_config["test-server"], idleTimeout=0.01),
+        }
+        manager = MCPServerManager(servers_config, idle_timeout=300)
+        assert manager._server_idle_timeout("stateful") == 0
+        assert manager._server_idle_timeout("short") == 0.01
+
+        stateful_process = MagicMock()
+        stateful_process.returncode = None
+        manager.server_processes["stateful"] = stateful_process
+        manager._ensure_idle_reaper()
+        assert manager._idle_reaper_task is None
+
+        short_process = MagicMock()
+        short_process.returncode = None
+        short_process.wait = AsyncMock(return_value=0)
+        manager.server_processes["short"] = short_process
+        manager._last_used["stateful"] = manager._last_used["short"] = 0.0
+        with patch('mcp_tools.IDLE_CHECK_INTERVAL', 0.01):
+            manager._ensure_idle_reaper()
+            await asyncio.sleep(0.05)
+
+        short_process.terminate.assert_called_once()
+        stateful_process.terminate.assert_not_called()
+        assert list(manager.server_processes) == ["stateful"]
+        manager._idle_reaper_task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_idle_reaper_skips_server_with_pending_requests(self):
+        """実行中のリクエストがあるサーバーは停止しないことのテスト"""
+        manager = MCPServerManager(self.servers_config, idle_timeout=0.01)
+        mock_process = MagicMock()
+        mock_process.returncode = None
+        manager.server_processes["test-server"] = mock_process
+        manager._pending_requests["test-server"] = {3: asyncio.get_running_loop().create_future()}
+
+        await manager._suspend_server("test-server")
+
+        mock_process.terminate.assert_not_called()
+        assert manager.server_processes["test-server"] is mock_process
+
+    @pytest.mark.asyncio
+    async def test_disconnect_all_servers_completes_when_cancelled(self):
+        """切断中に呼び出し元がキャンセルされても終了処理が完了することのテスト"""
+        finished = []
+
+        async def slow_cleanup(server_name):
+            await asyncio.sleep(0.05)
+            finished.append(server_name)
+
+        self.manager.server_processes["test-server"] = MagicMock()
+        with patch.object(self.manager, '_cleanup_server', side_effect=slow_cleanup):
+            task = asyncio.create_task(self.manager.disconnect_all_servers())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0.1)
+
+        assert finished == ["test-server"]
+
+    @pytest.mark.asyncio
+    async def test_disconnect_all_servers_kills_stragglers_on_timeout(self):
+        """切断が上限時間内に終わらない場合にプロセスを強制終了することのテスト"""
+        async def wedged_cleanup(server_name):
+            await asyncio.sleep(10)
+
+        mock_process = MagicMock()
+        mock_process.returncode = None
+        self.manager.server_processes["test-server"] = mock_process
+        with patch.object(self.manager, '_cleanup_server', side_effect=wedged_cleanup), \
+             patch('mcp_tools.DISCONNECT_ALL_TIMEOUT', 0.05):
+            await asyncio.wait_for(self.manager.disconnect_all_servers(), timeout=1.0)
+
+        mock_process.kill.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_disconnect_all_servers_unregisters_lazy_servers(self):
+        """プロセス未起動のサーバーも切断され、以降は起動しないことのテスト"""
+        server_config = self.servers_config["test-server"]
+        await self.manager._store_cached_tools("test-server", server_config, [{"name": "echo"}])
+        await self.manager.connect_server("test-server", server_config)
+
+        await self.manager.disconnect_all_servers()
+
+        info = self.manager.get_server_info()
+        assert info["servers"]["test-server"]["connected"] is False
+        assert self.manager.available_tools == {}
+        with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+            with pytest.raises(ValueError):
+                await self.manager.execute_tool("test-server_echo", {})
+            await self.manager.connect_server("test-server", server_config)
+            mock_subprocess.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_disconnect_all_servers_stops_starting_server(self):
+        """起動処理中のサーバーのプロセスを切断時に残さないことのテスト"""
+        init_line = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {}}).encode('utf-8') + b"\n"
+        tools_line = json.dumps({"jsonrpc": "2.0", "id": 2, "result": {"tools": [{"name": "echo"}]}}).encode('utf-8') + b"\n"
+        mock_process = AsyncMock()
+        mock_process.returncode = None
+        mock_process.stdin = MagicMock()
+        mock_process.stdin.drain = AsyncMock()
+        mock_process.stdin.is_closing.return_value = False
+        mock_process.terminate = MagicMock()
+
+        lines = [init_line, tools_line]
+
+        async def slow_readline():
+            await asyncio.sleep(0.05)
+            return lines.pop(0) if lines else b""
+
+        mock_process.stdout.readline = slow_readline
+
+        with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+             patch('asyncio.create_subprocess_exec', return_value=mock_process):
+            start = asyncio.create_task(self.manager._start_server("test-server", self.servers_config["test-server"]))
+            await asyncio.sleep(0.01)
+            await asyncio.wait_for(self.manager.disconnect_all_servers(), timeout=1.0)
+            await start
+
+        mock_process.terminate.assert_called_once()
+        assert self.manager.server_processes == {}
+        assert self.manager.available_tools == {}
+
+    @pytest.mark.asyncio
+    async def test_lazy_start_times_out_on_unresponsive_server(self):
+        """初期化に応答せず終了要求も無視するサーバーの遅延起動が上限時間で打ち切られることのテスト"""
+        import sys
+        import time
+
+        server_config = {
+            "command": sys.executable,
+            "args": ["-c", "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(30)"],
+            "env": {},
+        }
+        manager = MCPServerManager({"stuck": server_config})
+        await manager._store_cached_tools("stuck", server_config, [{"name": "echo"}])
+        await manager.connect_server("stuck", server_config)
+
+        spawned = []
+        create_subprocess_exec = asyncio.create_subprocess_exec
+
+        async def spawn(*args, **kwargs):
+            process = await create_subprocess_exec(*args, **kwargs)
+            spawned.append(process)
+            return process
+
+        start = time.monotonic()
+        with patch('asyncio.create_subprocess_exec', side_effect=spawn), \
+             patch('mcp_tools.CONNECT_TIMEOUT', 0.5), \
+             patch('mcp_tools.PROCESS_TERMINATE_TIMEOUT', 0.1):
+            with pytest.raises(Exception, match="ツールの実行に失敗しました"):
+                await manager.execute_tool("stuck_echo", {})
+
+        assert time.monotonic() - start < 5.0
+        assert not manager._start_locks["stuck"].locked()
+        assert spawned and spawned[0].returncode is not None
+
     @pytest.mark.asyncio
     async def test_disconnect_server(self):
         """サーバー切断のテスト"""
@@ -123,15 +334,118 @@ class TestMCPServerManager:
             
             result = await self.manager._check_npx_package(["-y", "test-package"], {})
             assert result is True
-    
+
+    @pytest.mark.asyncio
+    async def test_check_npx_package_uses_cache(self):
+        """確認済みNPXパッケージはnpm viewを再実行しないことのテスト"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manager = MCPServerManager(self.servers_config, temp_dir)
+
+            with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+                mock_process = AsyncMock()
+                mock_process.communicate.return_value = (b"test-package", b"")
+                mock_process.returncode = 0
+                mock_subprocess.return_value = mock_process
+
+                assert await manager._check_npx_package(["-y", "test-package"], {}) is True
+                assert await manager._check_npx_package(["-y", "test-package"], {}) is True
+                assert mock_subprocess.call_count == 1
+
+            # キャッシュファイルが保存され、新しいマネージャーでも再利用されること
+            assert (Path(temp_dir) / ".npm_view_cache.json").exists()
+            new_manager = MCPServerManager(self.servers_config, temp_dir)
+            with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+                assert await new_manager._check_npx_package(["-y", "test-package"], {}) is True
+                mock_subprocess.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_npm_view_cache_writes_keep_all_packages(self):
+        """並列接続でnpm viewキャッシュの書き込みが重なっても全パッケージ分が残ることのテスト"""
+        import time
+        import mcp_tools
+
+        write_cache_file = mcp_tools._write_cache_file
+        delays = [0.05, 0.0]
+
+        def slow_write(path, cache_data):
+            # 先に始まった書き込みほど遅く終わる状況を再現
+            time.sleep(delays.pop(0) if delays else 0.0)
+            write_cache_file(path, cache_data)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manager = MCPServerManager(self.servers_config, temp_dir)
+            mock_process = AsyncMock()
+            mock_process.communicate.return_value = (b"", b"")
+            mock_process.returncode = 0
+            with patch('asyncio.create_subprocess_exec', return_value=mock_process), \
+                 patch('mcp_tools._write_cache_file', side_effect=slow_write):
+                await asyncio.gather(
+                    manager._check_npx_package(["-y", "package-a"], {}),
+                    manager._check_npx_package(["-y", "package-b"], {}),
+                )
+            saved = json.loads((Path(temp_dir) / ".npm_view_cache.json").read_text(encoding="utf-8"))
+
+        assert set(saved) == {"package-a", "package-b"}
+
+    @pytest.mark.asyncio
+    async def test_check_npx_package_failure_not_cached(self):
+        """npm viewの失敗結果はキャッシュされないことのテスト"""
+        with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+            mock_process = AsyncMock()
+            mock_process.communicate.return_value = (b"", b"404")
+            mock_process.returncode = 1
+            mock_subprocess.return_value = mock_process
+
+            assert await self.manager._check_npx_package(["-y", "missing-package"], {}) is False
+            assert await self.manager._check_npx_package(["-y", "missing-package"], {}) is False
+            assert mock_subprocess.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_check_npx_package_concurrent_calls_share_lookup(self):
+        """同じパッケージの並列確認でnpm viewが1回だけ実行されることのテスト"""
+        async def slow_communicate():
+            await asyncio.sleep(0.05)
+            return (b"shared-package", b"")
+
+        with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+            mock_process = AsyncMock()
+            mock_process.communicate = slow_communicate
+            mock_process.returncode = 0
+            mock_subprocess.return_value = mock_process
+
+            results = await asyncio.gather(
+                self.manager._check_npx_package(["-y", "shared-package"], {}),
+                self.manager._check_npx_package(["-y", "shared-package"], {}),
+            )
+
+        assert results == [True, True]
+        assert mock_subprocess.call_count == 1
+        assert self.manager._npm_view_pending == {}
+
+    @pytest.mark.asyncio
+    async def test_check_npx_package_inherits_env_without_copy(self):
+        """追加の環境変数がない場合は環境変数をコピーせず継承することのテスト"""
+        with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+            mock_process = AsyncMock()
+            mock_process.communicate.return_value = (b"test-package", b"")
+            mock_process.returncode = 0
+            mock_subprocess.return_value = mock_process
+
+            await self.manager._check_npx_package(["-y", "env-package"], {})
+            assert mock_subprocess.call_args.kwargs["env"] is None
+
+            merged_env = {"PATH": "/usr/bin", "API_KEY": "value"}
+            await self.manager._check_npx_package(["-y", "env-package2"], merged_env)
+            assert mock_subprocess.call_args.kwargs["env"] is merged_env
+
     def test_get_server_info_with_tools(self):
         """ツールがある状態でのサーバー情報取得テスト"""
         # ツールを手動で追加
-        self.manager.available_tools["test-server_calculator"] = {
+        self.manager._register_tool("test-server_calculator", {
             "server": "test-server",
             "tool": {"name": "calculator", "description": "計算ツール"},
             "config": self.servers_config["test-server"]
-        }
+        })
         
         # モックプロセスを追加
         mock_process = AsyncMock()
@@ -146,6 +460,357 @@ class TestMCPServerManager:
         assert info["servers"]["test-server"]["tool_count"] == 1
         assert info["servers"]["test-server"]["connection_type"] == "jsonrpc"
 
+    @pytest.mark.asyncio
+    async def test_connect_reports_bounded_stderr_on_early_exit(self):
+        """初期化前にプロセスが終了した場合に標準エラー出力を上限付きで報告するテスト"""
+        mock_process = AsyncMock()
+        mock_process.stdin = MagicMock()
+        mock_process.stdin.drain = AsyncMock()
+        mock_process.stdout.readline = AsyncMock(return_value=b"")
+        mock_process.stderr.read = AsyncMock(return_value="起動エラー".encode("utf-8"))
+        mock_process.terminate = MagicMock()
+
+        with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+             patch('asyncio.create_subprocess_exec', return_value=mock_process):
+            with pytest.raises(Exception, match="初期化応答がありません: 起動エラー"):
+                await self.manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+
+        mock_process.stderr.read.assert_called_once_with(4096)
+        # 事前にシリアライズした初期化メッセージが送信されること
+        sent = json.loads(mock_process.stdin.write.call_args_list[0][0][0])
+        assert sent["method"] == "initialize"
+        assert sent["id"] == 1
+
+    @pytest.mark.asyncio
+    async def test_connect_reports_stderr_of_exited_server(self):
+        """初期化前に終了した実プロセスの標準エラー出力がエラーに残ることのテスト"""
+        import sys
+
+        server_config = {
+            "command": sys.executable,
+            "args": ["-c", "import sys; sys.stderr.write('boom-error'); sys.exit(1)"],
+            "env": {},
+        }
+        with pytest.raises(Exception, match="初期化応答がありません: boom-error"):
+            await self.manager._connect_server_jsonrpc("broken", server_config)
+
+    @pytest.mark.asyncio
+    async def test_connect_registers_tools(self):
+        """初期化とツール一覧取得が成功した場合にツールが登録されるテスト"""
+        init_response = {"jsonrpc": "2.0", "id": 1, "result": {}}
+        tools_response = {"jsonrpc": "2.0", "id": 2, "result": {"tools": [{"name": "echo", "description": "エコー"}]}}
+        mock_process = AsyncMock()
+        mock_process.stdin = MagicMock()
+        mock_process.stdin.drain = AsyncMock()
+        mock_process.stdout.readline = AsyncMock(side_effect=[
+            json.dumps(init_response).encode('utf-8') + b"\n",
+            json.dumps(tools_response).encode('utf-8') + b"\n",
+            b"",
+        ])
+
+        with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+             patch('asyncio.create_subprocess_exec', return_value=mock_process) as mock_exec:
+            await self.manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+
+        # 大きな応答も1行で読めるよう標準出力のバッファ上限を拡張していること
+        assert mock_exec.call_args.kwargs["limit"] == 1 << 20
+        sent = [json.loads(call[0][0]) for call in mock_process.stdin.write.call_args_list]
+        assert [message["method"] for message in sent] == ["initialize", "tools/list"]
+        assert sent[1]["id"] == 2
+        assert self.manager.server_processes["test-server"] is mock_process
+        assert self.manager.available_tools["test-server_echo"]["tool"]["name"] == "echo"
+        await self.manager._cleanup_server("test-server")
+
+    @pytest.mark.asyncio
+    async def test_connect_uses_cached_tool_catalog(self):
+        """ツール一覧キャッシュがある場合はtools/listを省略するテスト"""
+        init_line = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {}}).encode('utf-8') + b"\n"
+        tools_line = json.dumps({"jsonrpc": "2.0", "id": 2, "result": {"tools": [{"name": "echo"}]}}).encode('utf-8') + b"\n"
+
+        def make_process(lines):
+            mock_process = AsyncMock()
+            mock_process.stdin = MagicMock()
+            mock_process.stdin.drain = AsyncMock()
+            mock_process.stdout.readline = AsyncMock(side_effect=lines + [b""])
+            return mock_process
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            first_process = make_process([init_line, tools_line])
+            manager = MCPServerManager(self.servers_config, temp_dir)
+            with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+                 patch('asyncio.create_subprocess_exec', return_value=first_process):
+                await manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+            await manager._cleanup_server("test-server")
+            assert (Path(temp_dir) / "mcp_tool_cache.json").exists()
+
+            # 再起動後（新しいマネージャー）は初期化のみ送信される
+            second_process = make_process([init_line])
+            new_manager = MCPServerManager(self.servers_config, temp_dir)
+            with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+                 patch('asyncio.create_subprocess_exec', return_value=second_process):
+                await new_manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+
+            sent = [json.loads(call[0][0]) for call in second_process.stdin.write.call_args_list]
+            assert [message["method"] for message in sent] == ["initialize"]
+            assert "test-server_echo" in new_manager.available_tools
+            await new_manager._cleanup_server("test-server")
+
+            # 起動設定が変わった場合はキャッシュを使わない
+            changed_config = dict(self.servers_config["test-server"], args=["other.py"])
+            assert new_manager._get_cached_tools("test-server", changed_config) is None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_tool_catalog_writes_keep_all_servers(self):
+        """並列接続でツール一覧キャッシュの書き込みが重なっても全サーバー分が残ることのテスト"""
+        import time
+        import mcp_tools
+
+        write_cache_file = mcp_tools._write_cache_file
+        delays = [0.05, 0.0]
+
+        def slow_write(path, cache_data):
+            # 先に始まった書き込みほど遅く終わる状況を再現
+            time.sleep(delays.pop(0) if delays else 0.0)
+            write_cache_file(path, cache_data)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manager = MCPServerManager(self.servers_config, temp_dir)
+            with patch('mcp_tools._write_cache_file', side_effect=slow_write):
+                await asyncio.gather(
+                    manager._store_cached_tools("server1", {"command": "a"}, [{"name": "one"}]),
+                    manager._store_cached_tools("server2", {"command": "b"}, [{"name": "two"}]),
+                )
+            saved = json.loads((Path(temp_dir) / "mcp_tool_cache.json").read_text(encoding="utf-8"))
+
+        assert set(saved) == {"server1", "server2"}
+
+    @pytest.mark.asyncio
+    async def test_connect_server_lazy_spawn_with_cached_catalog(self):
+        """キャッシュがある場合はプロセスを起動せず、初回実行時に1回だけ起動するテスト"""
+        server_config = self.servers_config["test-server"]
+        await self.manager._store_cached_tools("test-server", server_config, [{"name": "echo"}])
+
+        with patch('asyncio.create_subprocess_exec') as mock_subprocess:
+            await self.manager.connect_server("test-server", server_config)
+            mock_subprocess.assert_not_called()
+
+        assert self.manager.available_tools["test-server_echo"]["process"] is None
+        info = self.manager.get_server_info()
+        assert info["servers"]["test-server"]["connection_type"] == "lazy"
+        assert info["servers"]["test-server"]["connected"] is True
+
+        started = []
+        live_process = MagicMock()
+        live_process.returncode = None
+
+        async def connect_jsonrpc(server_name, config):
+            await asyncio.sleep(0.01)
+            started.append(server_name)
+            self.manager._register_server_tools(server_name, config, [{"name": "echo"}], live_process)
+            self.manager.server_processes[server_name] = live_process
+            self.manager._lazy_servers.discard(server_name)
+
+        self.manager._connect_server_jsonrpc = AsyncMock(side_effect=connect_jsonrpc)
+        self.manager._execute_tool_jsonrpc = AsyncMock(return_value="ok")
+
+        results = await asyncio.gather(
+            self.manager.execute_tool("test-server_echo", {}),
+            self.manager.execute_tool("test-server_echo", {}),
+        )
+
+        assert results == ["ok", "ok"]
+        assert started == ["test-server"]
+        assert self.manager.get_server_info()["servers"]["test-server"]["connection_type"] == "jsonrpc"
+
+    @pytest.mark.asyncio
+    async def test_connect_merges_env_overrides_into_base_env(self):
+        """環境変数の上書き分がベース環境変数に合成されて渡されることのテスト"""
+        self.manager._base_env = {"PATH": "/usr/bin", "SECRET": "secret-value"}
+        server_config = {
+            "command": "python",
+            "args": [],
+            "env": {"API_KEY": "env:SECRET", "MODE": "test", "MISSING": "env:UNDEFINED"},
+        }
+        mock_process = AsyncMock()
+        mock_process.stdin = MagicMock()
+        mock_process.stdin.drain = AsyncMock()
+        mock_process.stdout.readline = AsyncMock(return_value=b"")
+        mock_process.stderr.read = AsyncMock(return_value=b"")
+        mock_process.terminate = MagicMock()
+
+        with patch('mcp_tools._which', return_value="/usr/bin/python"), \
+             patch('asyncio.create_subprocess_exec', return_value=mock_process) as mock_subprocess:
+            with pytest.raises(Exception):
+                await self.manager._connect_server_jsonrpc("test-server", server_config)
+
+        assert mock_subprocess.call_args.kwargs["env"] == {
+            "PATH": "/usr/bin",
+            "SECRET": "secret-value",
+            "API_KEY": "secret-value",
+            "MODE": "test",
+        }
+        assert self.manager._base_env == {"PATH": "/usr/bin", "SECRET": "secret-value"}
+
+    @pytest.mark.asyncio
+    async def test_connect_all_servers_in_parallel(self):
+        """複数サーバーへの接続が並列に行われることのテスト"""
+        import time
+
+        manager = MCPServerManager({
+            "server1": {"command": "python", "args": []},
+            "server2": {"command": "python", "args": []},
+            "server3": {"command": "python", "args": []},
+        })
+
+        async def slow_connect(server_name, server_config):
+            await asyncio.sleep(0.2)
+            manager.server_processes[server_name] = MagicMock()
+
+        with patch.object(manager, 'connect_server', side_effect=slow_connect):
+            start = time.monotonic()
+            await manager.connect_all_servers()
+            elapsed = time.monotonic() - start
+
+        assert elapsed < 0.5
+        assert set(manager.server_processes) == {"server1", "server2", "server3"}
+        assert "MCP接続結果: 成功3個、失敗0個 (合計3個)" in manager.tool_registration_log
+
+    def test_which_is_cached(self):
+        """コマンドパス解決がキャッシュされることのテスト"""
+        import mcp_tools
+
+        mcp_tools._which.cache_clear()
+        try:
+            with patch('shutil.which', return_value="/usr/bin/npx") as mock_which:
+                assert mcp_tools._which("npx") == "/usr/bin/npx"
+                assert mcp_tools._which("npx") == "/usr/bin/npx"
+                mock_which.assert_called_once_with("npx")
+        finally:
+            mcp_tools._which.cache_clear()
+
+    @pytest.mark.asyncio
+    async def test_command_not_found_is_not_cached(self):
+        """見つからなかったコマンドは次回の接続で再解決されることのテスト"""
+        import mcp_tools
+
+        mcp_tools._which.cache_clear()
+        try:
+            with patch('shutil.which', side_effect=[None, "/usr/bin/python"]) as mock_which, \
+                 patch('asyncio.create_subprocess_exec', side_effect=FileNotFoundError()) as mock_exec:
+                with pytest.raises(ValueError, match="コマンドが見つかりません: python"):
+                    await self.manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+                mock_exec.assert_not_called()
+
+                # 後からインストールされたコマンドはプロセス起動まで進むこと
+                with pytest.raises(ValueError):
+                    await self.manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+                assert mock_which.call_count == 2
+                mock_exec.assert_called_once()
+        finally:
+            mcp_tools._which.cache_clear()
+
+    @pytest.mark.asyncio
+    async def test_connect_failure_invalidates_caches(self):
+        """初期化に失敗した場合にパス解決とツール一覧のキャッシュを破棄するテスト"""
+        import mcp_tools
+
+        mock_process = AsyncMock()
+        mock_process.stdin = MagicMock()
+        mock_process.stdin.drain = AsyncMock()
+        mock_process.stdout.readline = AsyncMock(return_value=b"")
+        mock_process.stderr.read = AsyncMock(return_value=b"")
+        mock_process.terminate = MagicMock()
+        server_config = self.servers_config["test-server"]
+        await self.manager._store_cached_tools("test-server", server_config, [{"name": "echo"}])
+
+        mcp_tools._which.cache_clear()
+        try:
+            with patch('shutil.which', return_value="/usr/bin/python") as mock_which, \
+                 patch('asyncio.create_subprocess_exec', return_value=mock_process):
+                with pytest.raises(Exception, match="初期化応答がありません"):
+                    await self.manager._connect_server_jsonrpc("test-server", server_config)
+                mcp_tools._which("python")
+                assert mock_which.call_count == 2
+        finally:
+            mcp_tools._which.cache_clear()
+        assert self.manager._get_cached_tools("test-server", server_config) is None
+
+    @pytest.mark.asyncio
+    async def test_connect_spawn_file_not_found(self):
+        """キャッシュしたコマンドが起動時に見つからない場合のテスト"""
+        import mcp_tools
+
+        mcp_tools._which.cache_clear()
+        try:
+            with patch('shutil.which', return_value="/usr/bin/python") as mock_which, \
+                 patch('asyncio.create_subprocess_exec', side_effect=FileNotFoundError()):
+                with pytest.raises(ValueError, match="コマンドが見つかりません: python"):
+                    await self.manager._connect_server_jsonrpc("test-server", self.servers_config["test-server"])
+                # パス解決のキャッシュが破棄され、次回は再解決されること
+                mcp_tools._which("python")
+                assert mock_which.call_count == 2
+        finally:
+            mcp_tools._which.cache_clear()
+
+    def test_message_codec_with_and_without_orjson(self):
+        """JSON-RPCメッセージのエンコード/デコードのテスト（orjson有無の両方）"""
+        import mcp_tools
+
+        message = {"jsonrpc": "2.0", "id": 3, "params": {"text": "日本語"}}
+        for orjson_module in (mcp_tools.orjson, None):
+            with patch.object(mcp_tools, 'orjson', orjson_module):
+                encoded = mcp_tools._encode_message(message)
+                assert isinstance(encoded, bytes)
+                assert encoded.endswith(b"\n")
+                assert mcp_tools._decode_message(encoded) == message
+                with pytest.raises(json.JSONDecodeError):
+                    mcp_tools._decode_message(b"invalid json\n")
+
+    @pytest.mark.asyncio
+    async def test_execute_tool_jsonrpc_concurrent_requests(self):
+        """同じサーバーへの並行リクエストが応答IDで振り分けられることのテスト"""
+        mock_process = MagicMock()
+        responses = asyncio.Queue()
+        requests = []
+        draining = []
+
+        async def drain():
+            # 書き込みロックにより同時にdrainされないこと
+            assert not draining
+            draining.append(True)
+            await asyncio.sleep(0.01)
+            draining.pop()
+
+        mock_process.stdin.drain = drain
+
+        def write(data):
+            requests.append(json.loads(data))
+            # 2件揃ったら逆順に応答する
+            if len(requests) == 2:
+                for request in reversed(requests):
+                    text = request["params"]["arguments"]["value"]
+                    response = {"jsonrpc": "2.0", "id": request["id"], "result": {"content": [{"text": text}]}}
+                    responses.put_nowait(json.dumps(response).encode('utf-8') + b"\n")
+
+        mock_process.stdin.write.side_effect = write
+        mock_process.stdout.readline = AsyncMock(side_effect=responses.get)
+        tool_info = {"server": "test-server", "tool": {"name": "echo"}, "process": mock_process}
+
+        results = await asyncio.gather(
+            self.manager._execute_tool_jsonrpc(tool_info, {"value": "first"}),
+            self.manager._execute_tool_jsonrpc(tool_info, {"value": "second"}),
+        )
+
+        assert results == ["first", "second"]
+        assert requests[0]["id"] != requests[1]["id"]
+        assert self.manager._pending_requests["test-server"] == {}
+
+        # 切断時は読み取りタスクが停止すること
+        reader_task = self.manager._reader_tasks["test-server"]
+        await self.manager._cleanup_server("test-server")
+        await asyncio.sleep(0)
+        assert reader_task.done()
+
 
 class TestJSONRPCCommunication:
     """JSON-RPC通信のテスト"""
@@ -157,24 +822,32 @@ class TestJSONRPCCommunication:
         
         # ツール実行用のJSONメッセージをテスト
         tool_info = {
+            "server": "test",
             "tool": {"name": "test_tool"},
             "process": AsyncMock()
         }
         
         # stdin/stdoutをモック化
-        mock_stdin = AsyncMock()
+        mock_stdin = MagicMock()
+        mock_stdin.drain = AsyncMock()
         mock_stdout = AsyncMock()
         
-        # 正常な応答をモック
-        response_data = {
-            "jsonrpc": "2.0",
-            "id": 1234,
-            "result": {
-                "content": [{"text": "テスト結果"}]
+        # 送信されたリクエストIDで正常な応答を返す
+        responses = asyncio.Queue()
+        
+        def write(data):
+            request = json.loads(data)
+            response_data = {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "result": {
+                    "content": [{"text": "テスト結果"}]
+                }
             }
-        }
-        response_line = (json.dumps(response_data) + "\n").encode('utf-8')
-        mock_stdout.readline.return_value = response_line
+            responses.put_nowait((json.dumps(response_data) + "\n").encode('utf-8'))
+        
+        mock_stdin.write.side_effect = write
+        mock_stdout.readline.side_effect = responses.get
         
         tool_info["process"].stdin = mock_stdin
         tool_info["process"].stdout = mock_stdout
@@ -247,6 +920,97 @@ class TestMCPSetup:
                 # サーバー情報が含まれることを確認
                 assert "設定されたサーバー: filesystem, calculator" in result
 
+    def test_setup_mcp_tools_reads_idle_timeout(self):
+        """設定ファイルのidleTimeoutがマネージャーに渡されることのテスト"""
+        import mcp_tools
+
+        config_data = {"idleTimeout": 0, "mcpServers": {"calculator": {"command": "python", "args": ["calculator.py"]}}}
+        with patch('os.path.exists', return_value=True), \
+             patch('mcp_tools._load_mcp_config', return_value=config_data):
+            setup_mcp_tools(MagicMock(), MagicMock(), config_dir="./UserData")
+
+        assert mcp_tools.mcp_manager._idle_timeout == 0
+
+    def test_resolve_config_dir(self):
+        """設定ディレクトリ探索のテスト（見つからない場合は最後の候補）"""
+        import os
+        import mcp_tools
+
+        project_dir = os.path.dirname(os.path.dirname(os.path.abspath(mcp_tools.__file__)))
+        original = mcp_tools._resolved_config_dir
+        try:
+            mcp_tools._resolved_config_dir = None
+            with patch('os.path.exists', return_value=True):
+                assert mcp_tools._resolve_config_dir() == os.path.join(project_dir, "UserData")
+
+            mcp_tools._resolved_config_dir = None
+            with patch('os.path.exists', return_value=False):
+                expected = os.path.join(os.path.dirname(project_dir), "UserData")
+                assert mcp_tools._resolve_config_dir() == expected
+
+            # 2回目以降は探索せずにキャッシュを返す
+            with patch('os.path.exists', side_effect=AssertionError("should not probe")):
+                assert mcp_tools._resolve_config_dir() == expected
+        finally:
+            mcp_tools._resolved_config_dir = original
+
+    def test_load_mcp_config_cached_by_mtime(self):
+        """MCP設定ファイルが更新時刻でキャッシュされることのテスト"""
+        import os
+        from mcp_tools import _load_mcp_config
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            config_path = os.path.join(temp_dir, "cocoroAiMcp.json")
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump({"mcpServers": {"a": {"command": "python"}}}, f)
+
+            first = _load_mcp_config(config_path)
+            # 更新されていなければファイルを開かずにキャッシュを返す
+            with patch('builtins.open', side_effect=AssertionError("should not reopen")):
+                assert _load_mcp_config(config_path) is first
+
+            # 更新時刻が変われば読み直す
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump({"mcpServers": {"b": {"command": "node"}}}, f)
+            stat = os.stat(config_path)
+            os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            assert "b" in _load_mcp_config(config_path)["mcpServers"]
+
+    @pytest.mark.asyncio
+    async def test_register_dynamic_tools_binds_tool_key(self):
+        """登録した実行関数がそれぞれのツールキーに固定されることのテスト"""
+        from mcp_tools import register_dynamic_tools
+
+        manager = MCPServerManager({})
+        manager._register_tool("srv_a", {"server": "srv", "tool": {"name": "a"}})
+        manager._register_tool("srv_b", {"server": "srv", "tool": {"name": "b"}})
+        manager.execute_tool = AsyncMock(return_value="ok")
+
+        registered = {}
+        sts = MagicMock()
+        sts.llm.tool.side_effect = lambda spec: lambda func: registered.setdefault(spec["function"]["name"], func)
+
+        await register_dynamic_tools(sts, manager)
+
+        assert set(registered) == {"srv_a", "srv_b"}
+        assert await registered["srv_a"](tool_name="srv_b", x=1) == "ok"
+        manager.execute_tool.assert_called_once_with("srv_a", {"tool_name": "srv_b", "x": 1})
+
+    def test_tool_spec_reused_across_reconnect(self):
+        """再接続で定義が変わらないツールは変換済みの仕様を使い回すことのテスト"""
+        manager = MCPServerManager({})
+        tool = {"name": "echo", "description": "エコー", "inputSchema": {"type": "object", "properties": {}}}
+
+        manager._register_server_tools("srv", {}, [tool], None)
+        spec = manager.available_tools["srv_echo"]["spec"]
+        assert spec["function"] == {"name": "srv_echo", "description": "エコー", "parameters": tool["inputSchema"]}
+
+        manager._register_server_tools("srv", {}, [dict(tool)], MagicMock())
+        assert manager.available_tools["srv_echo"]["spec"] is spec
+
+        manager._register_server_tools("srv", {}, [dict(tool, description="変更")], MagicMock())
+        assert manager.available_tools["srv_echo"]["spec"]["function"]["description"] == "変更"
+
 
 class TestMCPStatus:
     """MCP状態取得のテスト"""
@@ -370,22 +1134,88 @@ class TestErrorHandling:
         
         with pytest.raises(ValueError, match="ツール 'nonexistent_tool' が見つかりません"):
             await manager.execute_tool("nonexistent_tool", {})
-    
+
+    @pytest.mark.asyncio
+    async def test_execute_tool_error_keeps_live_connection(self):
+        """プロセスが生きている場合はツールエラーで再接続しないことのテスト"""
+        manager = MCPServerManager({})
+        process = MagicMock()
+        process.returncode = None
+        manager._register_tool("srv_tool", {"server": "srv", "tool": {"name": "tool"}, "process": process, "config": {}})
+        manager._execute_tool_jsonrpc = AsyncMock(side_effect=Exception("MCPツールエラー: connection refused"))
+        manager._reconnect_server = AsyncMock()
+
+        with pytest.raises(Exception, match="ツールの実行に失敗しました"):
+            await manager.execute_tool("srv_tool", {})
+
+        manager._reconnect_server.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_execute_tool_error_after_server_suspended(self):
+        """実行中にサーバーが停止されても元のエラーで失敗することのテスト"""
+        manager = MCPServerManager({})
+        process = MagicMock()
+        process.returncode = None
+        tool_info = {"server": "srv", "tool": {"name": "tool"}, "process": process, "config": {}}
+        manager._register_tool("srv_tool", tool_info)
+
+        async def fail_after_suspend(info, arguments):
+            # アイドル停止でプロセスが終了し、tool_infoのプロセスが未起動に戻された状態
+            process.returncode = -15
+            info["process"] = None
+            raise Exception("MCPサーバー 'srv' が切断されました")
+
+        manager._execute_tool_jsonrpc = AsyncMock(side_effect=fail_after_suspend)
+        manager._reconnect_server = AsyncMock()
+
+        with pytest.raises(Exception, match="ツールの実行に失敗しました: MCPサーバー 'srv' が切断されました"):
+            await manager.execute_tool("srv_tool", {})
+
+        manager._reconnect_server.assert_called_once_with("srv", {})
+
+    @pytest.mark.asyncio
+    async def test_execute_tool_reconnects_dead_process_first(self):
+        """プロセスが終了している場合は実行前に再接続することのテスト"""
+        manager = MCPServerManager({})
+        dead_process = MagicMock()
+        dead_process.returncode = 1
+        live_process = MagicMock()
+        live_process.returncode = None
+        manager._register_tool("srv_tool", {"server": "srv", "tool": {"name": "tool"}, "process": dead_process, "config": {}})
+
+        async def start_server(server_name, server_config):
+            manager._unregister_server_tools(server_name)
+            manager._register_tool("srv_tool", {"server": "srv", "tool": {"name": "tool"}, "process": live_process, "config": {}})
+
+        manager._start_server = AsyncMock(side_effect=start_server)
+        manager._execute_tool_jsonrpc = AsyncMock(return_value="結果")
+
+        assert await manager.execute_tool("srv_tool", {}) == "結果"
+        manager._start_server.assert_called_once_with("srv", {})
+        assert manager._execute_tool_jsonrpc.call_args[0][0]["process"] is live_process
+
     @pytest.mark.asyncio
     async def test_jsonrpc_timeout_error(self):
         """JSON-RPC通信タイムアウトのテスト"""
         manager = MCPServerManager({})
         
         tool_info = {
+            "server": "test",
             "tool": {"name": "slow_tool"},
             "process": AsyncMock()
         }
         
-        # タイムアウトを発生させる
-        tool_info["process"].stdout.readline = AsyncMock(side_effect=asyncio.TimeoutError())
+        # 応答が返ってこない状態でタイムアウトを発生させる
+        async def never_respond():
+            await asyncio.Event().wait()
+        tool_info["process"].stdout.readline = never_respond
         
-        with pytest.raises(Exception, match="ツールの実行がタイムアウトしました"):
-            await manager._execute_tool_jsonrpc(tool_info, {})
+        with patch('mcp_tools.TOOL_CALL_TIMEOUT', 0.05):
+            with pytest.raises(Exception, match="ツールの実行がタイムアウトしました"):
+                await manager._execute_tool_jsonrpc(tool_info, {})
+        
+        assert manager._pending_requests["test"] == {}
+        await manager._cleanup_server("test")
     
     @pytest.mark.asyncio
     async def test_jsonrpc_json_decode_error(self):
@@ -393,12 +1223,13 @@ class TestErrorHandling:
         manager = MCPServerManager({})
         
         tool_info = {
+            "server": "test",
             "tool": {"name": "broken_tool"},
             "process": AsyncMock()
         }
         
         # 不正なJSONを返す
-        tool_info["process"].stdout.readline.return_value = b"invalid json\n"
+        tool_info["process"].stdout.readline.side_effect = [b"invalid json\n", b""]
         
         with pytest.raises(Exception, match="ツール応答の解析に失敗しました"):
             await manager._execute_tool_jsonrpc(tool_info, {})
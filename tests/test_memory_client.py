@@ -1,4 +1,6 @@
 """memory_client.py のユニットテスト"""
+import asyncio
+import json
 import unittest
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -128,6 +130,80 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(user_msg["metadata"]["notification_app"], "TestApp")
         self.assertEqual(user_msg["metadata"]["notification_title"], "テスト通知")
 
+        # アシスタント応答のメタデータにはユーザー側の追加情報が混ざらないこと
+        assistant_msg = self.client._message_queue[1]
+        self.assertEqual(assistant_msg["metadata"], {"session_id": "test_session", "user_id": "test_user"})
+
+    async def test_enqueue_desktop_monitoring_message(self):
+        """デスクトップモニタリングは画像説明とアシスタント応答のみ保存するテスト"""
+        request = MagicMock()
+        request.text = "<cocoro-desktop-monitoring>"
+        request.session_id = "test_session"
+        request.user_id = "test_user"
+        request.metadata = {"image_description": "エディタの画面", "image_category": "作業"}
+
+        response = MagicMock()
+        response.text = "作業中ですね"
+
+        await self.client.enqueue_messages(request, response)
+
+        self.assertEqual([m["role"] for m in self.client._message_queue], ["system", "assistant"])
+        system_msg = self.client._message_queue[0]
+        self.assertEqual(system_msg["content"], "[画像が共有されました: エディタの画面] (分類: 作業//)")
+        self.assertEqual(system_msg["metadata"], {
+            "session_id": "test_session",
+            "user_id": "test_user",
+            "type": "image_description",
+            "image_category": "作業",
+            "image_mood": "",
+            "image_time": "",
+        })
+
+    def test_determine_message_type(self):
+        """メッセージタイプ判定のテスト"""
+        from memory_client import MessageType
+
+        cases = {
+            "こんにちは": MessageType.USER_CHAT,
+            "a < b の比較": MessageType.USER_CHAT,
+            '<cocoro-notification>{"from": "LINE"}</cocoro-notification>': MessageType.NOTIFICATION,
+            "<cocoro-desktop-monitoring>": MessageType.DESKTOP_MONITORING,
+            None: MessageType.USER_CHAT,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                request = MagicMock()
+                request.text = text
+                self.assertEqual(self.client._determine_message_type(request), expected)
+
+    def test_remove_image_prefix(self):
+        """画像プレフィックス除去のテスト"""
+        cases = {
+            "[画像を共有しました: 夕日]\n綺麗でしょ": "綺麗でしょ",
+            "[画像: 猫]\nかわいい": "かわいい",
+            "[2枚の画像: 猫と犬]\nどっちが好き？": "どっちが好き？",
+            "[LINEから画像付き通知: 写真]\n見て": "見て",
+            "[LINEから3枚の画像付き通知: 写真]": "",
+            "普通のメッセージ": "普通のメッセージ",
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.client._remove_image_prefix(text), expected)
+
+    def test_extract_notification_info(self):
+        """通知タグからの情報抽出のテスト"""
+        text = '<cocoro-notification>\n{"from": "LINE", "message": "こんにちは"}\n</cocoro-notification>'
+        self.assertEqual(
+            self.client._extract_notification_info(text),
+            {"from": "LINE", "message": "こんにちは"},
+        )
+        self.assertEqual(self.client._extract_notification_info("通知なし"), {})
+        # JSONとして解析できない場合は空の辞書を返す
+        self.assertEqual(
+            self.client._extract_notification_info("<cocoro-notification> {壊れた</cocoro-notification>"),
+            {},
+        )
+
     @patch('memory_client.httpx.AsyncClient.post')
     async def test_save_history_success(self, mock_post):
         """履歴保存成功のテスト"""
@@ -138,9 +214,9 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
         mock_post.return_value = mock_response
 
         # テストメッセージをキューに追加
-        self.client._message_queue = [
+        self.client._message_queue.append(
             {"role": "user", "content": "テストメッセージ", "metadata": {"session_id": "test"}}
-        ]
+        )
 
         # 履歴を保存
         await self.client.save_history("test_user", "test_session")
@@ -154,21 +230,134 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
     @patch('memory_client.httpx.AsyncClient.post')
     async def test_save_history_failure(self, mock_post):
         """履歴保存失敗のテスト"""
-        # 例外を発生させる
-        mock_post.side_effect = Exception("Connection error")
-
         # テストメッセージをキューに追加
         original_messages = [
             {"role": "user", "content": "テストメッセージ", "metadata": {"session_id": "test"}}
         ]
-        self.client._message_queue = original_messages.copy()
+        self.client._message_queue.extend(original_messages)
+
+        # 送信中に別のメッセージが追加された後、例外を発生させる
+        async def post_and_enqueue(*args, **kwargs):
+            self.client._message_queue.append({"role": "user", "content": "後続", "metadata": {}})
+            raise Exception("Connection error")
+
+        mock_post.side_effect = post_and_enqueue
 
         # 履歴を保存（失敗するはず）
         await self.client.save_history("test_user", "test_session")
 
-        # メッセージがキューに戻されることを確認
+        # 失敗したメッセージが元の順序でキューの先頭に戻されることを確認
+        self.assertEqual(
+            [m["content"] for m in self.client._message_queue],
+            ["テストメッセージ", "後続"],
+        )
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_coalesces_burst(self, mock_post):
+        """短時間に続いた同じセッションの履歴保存要求が1回の送信にまとめられるテスト"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        self.client._message_queue.append({"role": "user", "content": "1つ目", "metadata": {}})
+        first = asyncio.create_task(self.client.save_history("test_user", "session_a"))
+        await asyncio.sleep(0)
+        self.client._message_queue.append({"role": "user", "content": "2つ目", "metadata": {}})
+        second = asyncio.create_task(self.client.save_history("test_user", "session_a"))
+        await asyncio.gather(first, second)
+
+        mock_post.assert_called_once()
+        body = mock_post.call_args.kwargs.get("json") or json.loads(mock_post.call_args.kwargs["content"])
+        self.assertEqual([m["content"] for m in body["messages"]], ["1つ目", "2つ目"])
+        self.assertEqual(body["session_id"], "session_a")
+        self.assertEqual(len(self.client._message_queue), 0)
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_burst_keeps_sessions_apart(self, mock_post):
+        """短時間に続いた別セッションの履歴はそれぞれのセッションに保存されるテスト"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+
+        self.client._message_queue.append({"role": "user", "content": "A msg", "metadata": {}})
+        first = asyncio.create_task(self.client.save_history("test_user", "session_a"))
+        await asyncio.sleep(0.05)
+        self.client._message_queue.append({"role": "user", "content": "B msg", "metadata": {}})
+        second = asyncio.create_task(self.client.save_history("test_user", "session_b"))
+        await asyncio.gather(first, second)
+
+        bodies = [
+            call.kwargs.get("json") or json.loads(call.kwargs["content"])
+            for call in mock_post.call_args_list
+        ]
+        self.assertEqual(
+            {body["session_id"]: [m["content"] for m in body["messages"]] for body in bodies},
+            {"session_a": ["A msg"], "session_b": ["B msg"]},
+        )
+        self.assertEqual(len(self.client._message_queue), 0)
+
+    @patch('memory_client.HISTORY_RETRY_BASE_DELAY', 0)
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_retries_server_error(self, mock_post):
+        """5xxの場合は再試行して保存することのテスト"""
+        import httpx
+
+        request = httpx.Request("POST", f"{self.base_url}/history")
+        mock_post.side_effect = [httpx.Response(503, request=request), httpx.Response(200, request=request)]
+        self.client._message_queue.append({"role": "user", "content": "テスト", "metadata": {}})
+
+        await self.client.save_history("test_user", "test_session")
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(len(self.client._message_queue), 0)
+
+    @patch('memory_client.HISTORY_FLUSH_DELAY', 0)
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_skips_retry_when_closing(self, mock_post):
+        """クライアント終了中はタイムアウトしても再試行しないことのテスト"""
+        import httpx
+
+        mock_post.side_effect = httpx.ReadTimeout("応答がありません")
+        self.client._message_queue.append({"role": "user", "content": "テスト", "metadata": {}})
+
+        flush = asyncio.ensure_future(self.client.save_history("test_user", "test_session"))
+        await self.client.close()
+        await flush
+
+        mock_post.assert_called_once()
         self.assertEqual(len(self.client._message_queue), 1)
 
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_drops_rejected_batch(self, mock_post):
+        """4xxの場合は再試行もキューへの戻しも行わないことのテスト"""
+        import httpx
+
+        request = httpx.Request("POST", f"{self.base_url}/history")
+        mock_post.return_value = httpx.Response(422, request=request)
+        self.client._message_queue.append({"role": "user", "content": "テスト", "metadata": {}})
+
+        await self.client.save_history("test_user", "test_session")
+
+        mock_post.assert_called_once()
+        self.assertEqual(len(self.client._message_queue), 0)
+
+    @patch('memory_client.MAX_QUEUED_MESSAGES', 3)
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_save_history_failure_bounds_queue(self, mock_post):
+        """保存失敗が続いてもキューが上限を超えないことのテスト"""
+        import httpx
+
+        mock_post.side_effect = httpx.ConnectError("接続できません")
+        for i in range(5):
+            self.client._message_queue.append({"role": "user", "content": f"メッセージ{i}", "metadata": {}})
+
+        await self.client.save_history("test_user", "test_session")
+
+        self.assertEqual(
+            [m["content"] for m in self.client._message_queue],
+            ["メッセージ2", "メッセージ3", "メッセージ4"],
+        )
+
     @patch('memory_client.httpx.AsyncClient.post')
     async def test_search_success(self, mock_post):
         """記憶検索成功のテスト"""
@@ -178,6 +367,7 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
         mock_response.json.return_value = {
             "retrieved_data": "テスト記憶データ"
         }
+        mock_response.content = json.dumps(mock_response.json.return_value).encode("utf-8")
         mock_response.raise_for_status.return_value = None
         mock_post.return_value = mock_response
 
@@ -187,6 +377,146 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
         # 結果を確認
         self.assertIsNotNone(result)
         self.assertEqual(result["retrieved_data"], "テスト記憶データ")
+        # 記憶検索は書き込みより長い読み取りタイムアウトで実行されること
+        import memory_client
+        self.assertIs(mock_post.call_args.kwargs["timeout"], memory_client.SEARCH_TIMEOUT)
+        self.assertGreater(memory_client.SEARCH_TIMEOUT.read, memory_client.HISTORY_TIMEOUT.read)
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_post_json_body_with_and_without_orjson(self, mock_post):
+        """JSONボディの送信テスト（orjson有無の両方）"""
+        import memory_client
+
+        payload = {"user_id": "test_user", "knowledge": "猫が好き"}
+        await self.client._post_json(f"{self.base_url}/knowledge", payload)
+        kwargs = mock_post.call_args.kwargs
+        if memory_client.orjson is not None:
+            self.assertEqual(kwargs["headers"]["Content-Type"], "application/json")
+            # 日本語はエスケープせずUTF-8のまま送信されること
+            self.assertIn("猫が好き".encode("utf-8"), kwargs["content"])
+            self.assertEqual(json.loads(kwargs["content"]), payload)
+
+        with patch.object(memory_client, "orjson", None):
+            await self.client._post_json(f"{self.base_url}/knowledge", payload)
+        self.assertEqual(mock_post.call_args.kwargs["json"], payload)
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_search_cache_hit_and_invalidation(self, mock_post):
+        """同じクエリの再検索はキャッシュを使い、ナレッジ追加で破棄されるテスト"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {"retrieved_data": "猫が好き"}
+        mock_response.content = json.dumps(mock_response.json.return_value).encode("utf-8")
+        mock_post.return_value = mock_response
+
+        first = await self.client.search("test_user", "好きな動物")
+        second = await self.client.search("test_user", " 好きな動物 ")
+        self.assertEqual(first, second)
+        self.assertEqual(mock_post.call_count, 1)
+
+        # 別ユーザーの検索はキャッシュを共有しない
+        await self.client.search("other_user", "好きな動物")
+        self.assertEqual(mock_post.call_count, 2)
+
+        # ナレッジ追加後は再検索する
+        await self.client.add_knowledge("test_user", "犬も好き")
+        await self.client.search("test_user", "好きな動物")
+        self.assertEqual(mock_post.call_count, 4)
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_search_cache_expires(self, mock_post):
+        """有効期限切れのキャッシュは使わないテスト"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {"retrieved_data": "データ"}
+        mock_response.content = json.dumps(mock_response.json.return_value).encode("utf-8")
+        mock_post.return_value = mock_response
+
+        with patch('memory_client.SEARCH_CACHE_TTL', -1.0):
+            await self.client.search("test_user", "クエリ")
+            await self.client.search("test_user", "クエリ")
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_search_started_before_invalidation_is_not_cached(self, mock_post):
+        """検索中にナレッジが追加された場合、その検索結果をキャッシュしないテスト"""
+        def make_response(data):
+            response = MagicMock()
+            response.raise_for_status.return_value = None
+            response.json.return_value = data
+            response.content = json.dumps(data).encode("utf-8")
+            return response
+
+        search_results = [{"retrieved_data": "古いデータ"}, {"retrieved_data": "新しいデータ"}]
+
+        async def post(url, *args, **kwargs):
+            if url.endswith("/search_direct"):
+                await asyncio.sleep(0.02)
+                return make_response(search_results.pop(0))
+            return make_response({})
+
+        mock_post.side_effect = post
+
+        slow_search = asyncio.ensure_future(self.client.search("test_user", "クエリ"))
+        await asyncio.sleep(0.005)
+        await self.client.add_knowledge("test_user", "新しい知識")
+        self.assertEqual((await slow_search)["retrieved_data"], "古いデータ")
+
+        result = await self.client.search("test_user", "クエリ")
+        self.assertEqual(result["retrieved_data"], "新しいデータ")
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_concurrent_searches_share_request(self, mock_post):
+        """同時に来た同一クエリの検索が1回の要求にまとめられるテスト"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {"retrieved_data": "データ"}
+        mock_response.content = json.dumps(mock_response.json.return_value).encode("utf-8")
+
+        async def slow_post(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return mock_response
+
+        mock_post.side_effect = slow_post
+
+        results = await asyncio.gather(
+            *(self.client.search("test_user", "クエリ") for _ in range(3))
+        )
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(self.client._search_pending, {})
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_search_after_invalidation_does_not_join_old_request(self, mock_post):
+        """ナレッジ追加後の検索は実行中の古い検索を共有しないテスト"""
+        def make_response(data):
+            response = MagicMock()
+            response.raise_for_status.return_value = None
+            response.json.return_value = data
+            response.content = json.dumps(data).encode("utf-8")
+            return response
+
+        search_results = [{"retrieved_data": "古いデータ"}, {"retrieved_data": "新しいデータ"}]
+
+        async def post(url, *args, **kwargs):
+            if url.endswith("/search_direct"):
+                data = search_results.pop(0)
+                await asyncio.sleep(0.02)
+                return make_response(data)
+            return make_response({})
+
+        mock_post.side_effect = post
+
+        old_search = asyncio.ensure_future(self.client.search("test_user", "クエリ"))
+        await asyncio.sleep(0.005)
+        await self.client.add_knowledge("test_user", "新しい知識")
+        new_search = asyncio.ensure_future(self.client.search("test_user", "クエリ"))
+
+        self.assertEqual((await old_search)["retrieved_data"], "古いデータ")
+        self.assertEqual((await new_search)["retrieved_data"], "新しいデータ")
+        self.assertEqual(self.client._search_pending, {})
+        # 新しい検索の結果はキャッシュされる
+        self.assertEqual((await self.client.search("test_user", "クエリ"))["retrieved_data"], "新しいデータ")
 
     @patch('memory_client.httpx.AsyncClient.post')
     async def test_search_failure(self, mock_post):
@@ -241,6 +571,33 @@ class TestChatMemoryClient(unittest.IsolatedAsyncioTestCase):
         # acloseが呼ばれることを確認
         self.client.client.aclose.assert_called_once()
 
+    async def test_close_is_idempotent_and_context_manager(self):
+        """async withで閉じられ、2回目以降のcloseは何もしないことのテスト"""
+        async with ChatMemoryClient(self.base_url) as client:
+            client.client.aclose = AsyncMock()
+
+        await client.close()
+        client.client.aclose.assert_called_once()
+
+    @patch('memory_client.httpx.AsyncClient.post')
+    async def test_close_does_not_wait_for_stalled_flush(self, mock_post):
+        """応答しないChatMemoryへの履歴保存を上限時間で中断して閉じるテスト"""
+        async def stalled_post(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        mock_post.side_effect = stalled_post
+        self.client._message_queue.append({"role": "user", "content": "こんにちは"})
+        with patch('memory_client.HISTORY_FLUSH_DELAY', 0), \
+             patch('memory_client.CLOSE_FLUSH_TIMEOUT', 0.05):
+            flush = asyncio.ensure_future(self.client.save_history("test_user", "test_session"))
+            await asyncio.sleep(0.01)
+            mock_post.assert_called_once()
+            await asyncio.wait_for(self.client.close(), timeout=1.0)
+
+        self.assertEqual(self.client._flush_tasks, set())
+        with self.assertRaises(asyncio.CancelledError):
+            await flush
+
 
 class TestChatMemoryClientIntegration(unittest.IsolatedAsyncioTestCase):
     """ChatMemoryClient の非同期統合テストクラス"""
@@ -296,8 +653,7 @@ class TestChatMemoryClientIntegration(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(self.client._message_queue), 2)
         
         # キューを手動でクリア
-        async with self.client._queue_lock:
-            self.client._message_queue.clear()
+        self.client._message_queue.clear()
         
         # キューが空になることを確認
         self.assertEqual(len(self.client._message_queue), 0)
@@ -470,4 +470,23 @@ class TestMemoryToolsAsync:
         
         for config in configs:
             result = setup_memory_tools(mock_sts, config, mock_memory_client)
-            assert isinstance(result, str)
\ No newline at end of file
+            assert isinstance(result, str)
+
+    @pytest.mark.asyncio
+    async def test_memory_tools_queue_status_update(self):
+        """ツール実行時のステータス通知が送信待ちキュー経由で行われるテスト"""
+        from memory_tools import setup_memory_tools
+
+        registered = {}
+        mock_sts = MagicMock()
+        mock_sts.llm.tool.side_effect = lambda spec: lambda func: registered.setdefault(spec["function"]["name"], func)
+        mock_memory_client = AsyncMock()
+        mock_memory_client.search.return_value = None
+        mock_dock_client = MagicMock()
+
+        setup_memory_tools(mock_sts, {}, mock_memory_client, None, mock_dock_client)
+        await registered["search_memory"]("好きな食べ物", metadata={"user_id": "user"})
+        await registered["add_knowledge"]("猫が好き", metadata={"user_id": "user"})
+
+        assert [c.args[0] for c in mock_dock_client.queue_status_update.call_args_list] == ["記憶検索中", "記憶保存中"]
+        mock_dock_client.send_status_update.assert_not_called()